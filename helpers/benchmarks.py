@@ -0,0 +1,133 @@
+# coding: utf-8
+
+########################
+# Замеры производительности
+# запуск: python helpers/benchmarks.py [<имя замера> ...]
+########################
+
+import sys
+import timeit
+
+from rels import exceptions
+from rels.relations import _RelationMetaclass
+from rels.shortcuts import Enum
+
+
+BENCHMARK_RECORDS = tuple(('NAME_%d' % i, i) for i in range(100))
+
+
+class BENCHMARK_ENUM(Enum):
+    records = BENCHMARK_RECORDS
+
+
+def report(name, seconds, number):
+    print('%-60s %10.1f ns' % (name, seconds / number * 10**9))
+
+
+def measure(name, function, number=1000000, repeat=5):
+    report(name, min(timeit.repeat(function, number=number, repeat=repeat)), number)
+
+
+class _DoubleLookupMetaclass(_RelationMetaclass):
+
+    # previous implementation of _RelationMetaclass.__call__
+    def __call__(self, id_):
+        if id_ not in self._external_index:
+            raise exceptions.NotExternalValueError(id_)
+        return self._external_index[id_]
+
+
+class DOUBLE_LOOKUP_ENUM(Enum, metaclass=_DoubleLookupMetaclass):
+    records = BENCHMARK_RECORDS
+
+
+def benchmark_external_lookup():
+    measure('external lookup: double dict lookup (previous)', lambda: DOUBLE_LOOKUP_ENUM(57))
+    measure('external lookup: Relation(value)', lambda: BENCHMARK_ENUM(57))
+
+
+def benchmark_django_field():
+    from django.conf import settings
+
+    if not settings.configured:
+        settings.configure(DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}})
+
+    from django.db import connections, models
+    from rels.django import DjangoEnum, RelationIntegerField
+
+    class PreviousRelationIntegerField(RelationIntegerField):
+        # previous implementation of conversions
+
+        def get_prep_value(self, value):
+            return self._prepare_value(value)
+
+        def get_db_prep_save(self, value, connection):
+            return models.Field.get_db_prep_save(self, value, connection)
+
+        def from_db_value(self, value, expression, connection):
+            return self.to_python(value)
+
+    class DJANGO_ENUM(DjangoEnum):
+        records = tuple(('NAME_%d' % i, i, 'text %d' % i) for i in range(100))
+
+    connection = connections['default']
+
+    values = [i % 100 for i in range(100000)]
+    records = [DJANGO_ENUM(value) for value in values]
+
+    for field in (PreviousRelationIntegerField(relation=DJANGO_ENUM), RelationIntegerField(relation=DJANGO_ENUM)):
+        name = field.__class__.__name__
+
+        report('%s.from_db_value' % name,
+               min(timeit.repeat(lambda: [field.from_db_value(value, None, connection) for value in values],
+                                 number=1, repeat=5)),
+               len(values))
+
+        report('%s.get_db_prep_save' % name,
+               min(timeit.repeat(lambda: [field.get_db_prep_save(record, connection) for record in records],
+                                 number=1, repeat=5)),
+               len(records))
+
+
+def benchmark_serialization():
+    import json
+
+    from rels.relations import Record
+    from rels.serialization import FORMAT, RecordEncoder, RecordDecoder
+
+    # typical hand-written hook
+    def repr_default(obj):
+        if isinstance(obj, Record):
+            return repr(obj)
+        raise TypeError()
+
+    records = [BENCHMARK_ENUM.records[i % 100] for i in range(100000)]
+    names = [repr(record) for record in records]
+
+    encoder = RecordEncoder()
+    decoder = RecordDecoder(BENCHMARK_ENUM, format=FORMAT.FULL)
+
+    for name, function in (('json.dumps with repr hook (previous)', lambda: json.dumps(records, default=repr_default)),
+                           ('json.dumps with RecordEncoder', lambda: json.dumps(records, default=encoder)),
+                           ('decoding with Relation.get_from_name (previous)', lambda: [BENCHMARK_ENUM.get_from_name(name) for name in names]),
+                           ('decoding with RecordDecoder.decode_many', lambda: decoder.decode_many(names))):
+        report(name, min(timeit.repeat(function, number=1, repeat=5)), len(records))
+
+    try:
+        import orjson
+    except ImportError:
+        return
+
+    report('orjson.dumps with RecordEncoder',
+           min(timeit.repeat(lambda: orjson.dumps(records, default=encoder), number=1, repeat=5)),
+           len(records))
+
+
+BENCHMARKS = {'external_lookup': benchmark_external_lookup,
+              'django_field': benchmark_django_field,
+              'serialization': benchmark_serialization}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -1,7 +1,9 @@
 # coding: utf-8
 
-from rels.relations import Column, Record, Relation
+from rels.relations import Column, Index, Record, Relation, MISSING
+from rels.record_set import RecordSet, Subset
 from rels import exceptions
+from rels.instrumentation import stats
 from .shortcuts import Enum, EnumWithText, NullObject
 
-__all__ = [Column, Record, Relation, exceptions, Enum, EnumWithText, NullObject]
+__all__ = [Column, Index, Record, Relation, MISSING, RecordSet, Subset, exceptions, stats, Enum, EnumWithText, NullObject]
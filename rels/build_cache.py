@@ -0,0 +1,108 @@
+# coding: utf-8
+
+import os
+import json
+import pickle
+import marshal
+import hashlib
+import tempfile
+
+
+# change on every change of snapshot format or of checks, which results are stored in snapshots
+VERSION = 2
+
+# cache is disabled by default, directory can be set by environment variable or by enable()
+DIRECTORY = os.environ.get('RELS_BUILD_CACHE_DIR') or None
+
+
+def enable(directory):
+    '''
+    must be called before relations are imported
+    '''
+    global DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    DIRECTORY = directory
+
+
+def disable():
+    global DIRECTORY
+    DIRECTORY = None
+
+
+def is_enabled():
+    return DIRECTORY is not None
+
+
+def get_key(relation_class, columns, indexes, attributes_names, raw_records, lazy_indexes):
+    '''
+    returns hash of relation definition and raw records or None, if raw records can not be pickled
+    '''
+    definition = (VERSION,
+                  relation_class.__module__,
+                  relation_class.__qualname__,
+                  tuple((column.name, column.primary, column.unique, column.single_type, column.index_name,
+                         column.no_index, column.related_name, column.external, column.primary_checks,
+                         column.sorted_index, column.sorted_index_name)
+                        for column in columns),
+                  tuple((index.index_name, index.columns_names, index.unique) for index in indexes),
+                  tuple(sorted(attributes_names)),
+                  lazy_indexes)
+
+    raw_records = tuple(raw_records)
+
+    try:
+        # marshal is much faster, version 2 does not depend on objects references, so output is stable
+        data = marshal.dumps((definition, raw_records), 2)
+    except ValueError:
+        try:
+            # values of other types (for example, records of other relations)
+            data = pickle.dumps((definition, raw_records), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # values of records can be of any types
+            return None
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_path(key):
+    return os.path.join(DIRECTORY, '%s.json' % key)
+
+
+def is_names(value):
+    return isinstance(value, list) and all(isinstance(name, str) for name in value)
+
+
+def load(key):
+    '''
+    snapshots are stored as JSON, not pickled, since cache directory can be writable by other users,
+    snapshots of unexpected structure are ignored
+    '''
+    try:
+        with open(get_path(key), 'r', encoding='utf-8') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+    primary_checks = snapshot.get('primary_checks') if isinstance(snapshot, dict) else None
+
+    if not isinstance(primary_checks, dict) or not all(is_names(names) for names in primary_checks.values()):
+        return None
+
+    return {'primary_checks': {column_name: tuple(names) for column_name, names in primary_checks.items()}}
+
+
+def save(key, snapshot):
+    # snapshot is written into temporary file and moved, so concurrent processes never read partial snapshots
+    try:
+        descriptor, temporary_path = tempfile.mkstemp(dir=DIRECTORY, suffix='.tmp')
+    except OSError:
+        # cache is only optimization, build must not fail because of it
+        return
+
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+
+        os.replace(temporary_path, get_path(key))
+    except OSError:
+        os.remove(temporary_path)
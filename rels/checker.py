@@ -0,0 +1,202 @@
+# coding: utf-8
+'''
+offline checker of relations, intended for CI and pre-deploy hooks of projects, which use deferred checks mode
+
+    python -m rels.checker [--jobs N] <package> [<package> ...]
+
+imports packages with all submodules in deferred checks mode, finds all Relation subclasses,
+checks them in parallel and reports all violations
+'''
+
+import os
+import sys
+import pkgutil
+import argparse
+import importlib
+import traceback
+import concurrent.futures
+
+from rels import exceptions
+from rels import deferred_checks
+from rels.relations import iter_relations, _PrimaryCheck
+
+
+def import_packages(packages_names):
+    '''
+    returns list of (module name, error message) for modules, which can not be imported
+    '''
+    errors = []
+
+    def on_error(module_name):
+        errors.append((module_name, traceback.format_exc(limit=1).strip()))
+
+    for package_name in packages_names:
+        try:
+            package = importlib.import_module(package_name)
+        except Exception:
+            on_error(package_name)
+            continue
+
+        if not hasattr(package, '__path__'):
+            continue
+
+        # walk_packages imports only packages
+        for module_info in pkgutil.walk_packages(package.__path__, package_name + '.', onerror=on_error):
+            try:
+                importlib.import_module(module_info.name)
+            except Exception:
+                on_error(module_info.name)
+
+    return errors
+
+
+def find_relations(packages_names):
+    relations = []
+
+    for relation in iter_relations():
+        if any(relation.__module__ == name or relation.__module__.startswith(name + '.') for name in packages_names):
+            relations.append(relation)
+
+    return sorted(relations, key=lambda relation: (relation.__module__, relation.__qualname__))
+
+
+def check_relation(relation):
+    '''
+    returns list of all violations of restrictions of relation
+    '''
+    errors = []
+
+    def run(check, *argv):
+        try:
+            check(*argv)
+        except exceptions.RelsException as e:
+            errors.append(e)
+
+    records = relation.records
+    columns_values = relation._columns_values
+
+    for column in relation._columns:
+        run(column.check_single_type_restriction, records, columns_values[column.name])
+        run(column.check_uniqueness_restriction, records, columns_values[column.name])
+
+    for index in relation._indexes:
+        run(index.check_uniqueness_restriction, records, index.get_values(records, columns_values))
+
+    # primary checks are installed in columns order, so names, installed by previous columns, are collisions too
+    installed = set()
+
+    for column in relation._columns:
+        if not column.primary:
+            continue
+
+        values = columns_values[column.name]
+
+        duplicates = sorted(set(values) & relation._attributes_names)
+
+        if duplicates:
+            errors.append(exceptions.PrimaryDuplicatesRelationAttributeError(column.name, duplicates))
+
+        for record, id_ in zip(records, values):
+            attr_name = 'is_%s' % id_
+            check = relation._record_class.__dict__.get(attr_name)
+
+            if isinstance(check, _PrimaryCheck) and check.record is record and attr_name not in installed:
+                installed.add(attr_name)
+                continue
+
+            if column.primary_checks:
+                errors.append(exceptions.DuplicateIsPrimaryError(record, column, attr_name, id_))
+
+    return errors
+
+
+def format_errors(errors):
+    return ['%s: %s' % (error.__class__.__name__, error) for error in errors]
+
+
+def get_relation(module_name, qualname):
+    relation = importlib.import_module(module_name)
+
+    for name in qualname.split('.'):
+        relation = getattr(relation, name)
+
+    return relation
+
+
+def check_relation_by_name(module_name, qualname):
+    '''
+    runs in worker process, returns error messages, since not every exception can be pickled
+    '''
+    deferred_checks.enable()
+
+    return format_errors(check_relation(get_relation(module_name, qualname)))
+
+
+def check_packages(packages_names, jobs=None, output=sys.stdout):
+    '''
+    returns number of found violations
+    '''
+    checks_were_deferred = deferred_checks.is_enabled()
+
+    deferred_checks.enable()
+
+    try:
+        return _check_packages(packages_names, jobs, output)
+    finally:
+        if not checks_were_deferred:
+            deferred_checks.disable()
+
+
+def _check_packages(packages_names, jobs, output):
+    violations = 0
+
+    for module_name, message in import_packages(packages_names):
+        output.write('%s: import error\n%s\n' % (module_name, message))
+        violations += 1
+
+    relations = find_relations(packages_names)
+
+    # relations, defined in functions, can not be found by name in worker processes
+    names = [(relation.__module__, relation.__qualname__) for relation in relations if '<locals>' not in relation.__qualname__]
+    local_relations = [relation for relation in relations if '<locals>' in relation.__qualname__]
+
+    results = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(check_relation_by_name, module_name, qualname) for module_name, qualname in names]
+
+        for (module_name, qualname), future in zip(names, futures):
+            try:
+                errors = future.result()
+            except Exception as e:
+                errors = ['check error: %r' % e]
+
+            results.append(('%s.%s' % (module_name, qualname), errors))
+
+    for relation in local_relations:
+        results.append(('%s.%s' % (relation.__module__, relation.__qualname__),
+                        format_errors(check_relation(relation))))
+
+    for relation_name, errors in results:
+        for error in errors:
+            output.write('%s: %s\n' % (relation_name, error))
+
+        violations += len(errors)
+
+    output.write('checked %d relations, found %d violations\n' % (len(relations), violations))
+
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m rels.checker', description='check all relations in packages')
+    parser.add_argument('packages', nargs='+', help='names of packages (or modules) to check')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+
+    arguments = parser.parse_args(argv)
+
+    return 1 if check_packages(arguments.packages, jobs=arguments.jobs) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+# coding: utf-8
+
+import os
+
+
+# production mode: relations are created without checks of data, data must be checked by rels.checker before deploy
+ENABLED = os.environ.get('RELS_DEFERRED_CHECKS', '') not in ('', '0')
+
+
+def enable():
+    '''
+    must be called before relations are imported
+    '''
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def is_enabled():
+    return ENABLED
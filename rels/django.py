@@ -1,15 +1,40 @@
 # coding: utf-8
 
-
 from django.db import models
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import lookups as django_lookups
 from django.utils import functional
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ValidationError, FieldError, ImproperlyConfigured
 from django.core import validators as django_validators
 
+from rels import query
+from rels import exceptions
 from rels.relations import Record
+from rels.record_set import RecordSet
 from rels.shortcuts import EnumWithText
 
 
+RELATION_TRANSFORM_PREFIX = 'rel_'
+
+
+def relation_column_case(field_name, relation, column_name, relation_column='value', output_field=None, default=None):
+    '''
+    returns Case expression, which translates stored values of field into values of relation column,
+    so rows can be ordered, annotated and aggregated by record attributes in database.
+
+    Pairs of stored and column values are cached by relation projection, expressions are built on every call,
+    since output fields are usually created inline and can not be used as cache keys.
+    '''
+    whens = [models.When(**{field_name: stored_value,
+                            'then': models.Value(value, output_field=output_field)})
+             for stored_value, value in relation.projection(relation_column, column_name).items()]
+
+    if default is not None:
+        default = models.Value(default, output_field=output_field)
+
+    return models.Case(*whens, default=default, output_field=output_field)
+
+
 class DjangoEnum(EnumWithText):
 
     @classmethod
@@ -17,7 +42,91 @@ class DjangoEnum(EnumWithText):
         return [(record, record.text) for record in cls.records]
 
 
-class RelationIntegerField(models.IntegerField):
+class RelationColumnLookup(django_lookups.Lookup):
+    '''
+    compiled into "IN (...)" with stored values of records, selected by Relation.filter
+    '''
+    prepare_rhs = False
+
+    column_name = None
+    query_lookup = None
+
+    def as_sql(self, compiler, connection):
+        if hasattr(self.rhs, 'resolve_expression'):
+            raise FieldError('lookup "%s" does not support expressions' % self.lookup_name)
+
+        field_expression = self.lhs.lhs
+        relation = field_expression.output_field._relation
+
+        records = relation.filter(**{'%s__%s' % (self.column_name, self.query_lookup): self.rhs})
+
+        return django_lookups.In(field_expression, records).as_sql(compiler, connection)
+
+
+class RelationColumnIsNull(RelationColumnLookup):
+    '''
+    selects records with None in column, for isnull=True rows with NULL in field are selected too
+    (as by isnull lookups of other transforms); <field>__rel_<column>=None is compiled into this lookup
+    '''
+
+    def as_sql(self, compiler, connection):
+        if not isinstance(self.rhs, bool):
+            raise FieldError('lookup "%s" accepts only True or False' % self.lookup_name)
+
+        field_expression = self.lhs.lhs
+        relation = field_expression.output_field._relation
+
+        records = relation.filter(**{'%s__%s' % (self.column_name, 'exact' if self.rhs else 'ne'): None})
+
+        if not self.rhs:
+            return django_lookups.In(field_expression, records).as_sql(compiler, connection)
+
+        null_sql, null_params = django_lookups.IsNull(field_expression, True).as_sql(compiler, connection)
+
+        if not records:
+            return null_sql, null_params
+
+        records_sql, records_params = django_lookups.In(field_expression, records).as_sql(compiler, connection)
+
+        return '(%s OR %s)' % (records_sql, null_sql), list(records_params) + list(null_params)
+
+
+class RelationColumnTransform(models.Transform):
+    '''
+    <field>__rel_<column>__<lookup> — filter rows by column of records, lookups are the same as in Relation.filter
+    '''
+    column_name = None
+
+    _lookups = {}
+
+    def get_lookup(self, lookup_name):
+        if lookup_name == 'isnull':
+            base = RelationColumnIsNull
+        elif lookup_name in query.LOOKUPS:
+            base = RelationColumnLookup
+        else:
+            return None
+
+        key = (self.column_name, lookup_name)
+
+        if key not in self._lookups:
+            self._lookups[key] = type(base.__name__, (base,), {'lookup_name': lookup_name,
+                                                               'column_name': self.column_name,
+                                                               'query_lookup': lookup_name})
+        return self._lookups[key]
+
+    def as_sql(self, compiler, connection):
+        raise FieldError('transform "%s" can be used only with lookups' % self.lookup_name)
+
+
+class RelationFieldMixin(object):
+    '''
+    common conversions of records into stored values of relation_column and back
+
+    stored values are checked at model load time (in field constructor): they must have stored_value_type
+    and fit into storage width of field
+    '''
+    stored_value_type = int
 
     def __init__(self, *argv, **kwargs):
         self._relation = kwargs.get('relation')
@@ -26,18 +135,24 @@ class RelationIntegerField(models.IntegerField):
         if 'choices' not in kwargs and hasattr(self._relation, 'choices'):
             kwargs['choices'] = self._relation.choices()
 
-        # TODO: check if relation has column with relation_column name
-        # TODO: check if column has int type
-
         if 'relation' in kwargs: del kwargs['relation']
         if 'relation_column' in kwargs: del kwargs['relation_column']
 
-        super(RelationIntegerField, self).__init__(*argv, **kwargs)
+        if self._relation is not None:
+            self.check_stored_values(self._relation.column(self._relation_column), kwargs)
+
+        super(RelationFieldMixin, self).__init__(*argv, **kwargs)
+
+    def check_stored_values(self, values, field_kwargs):
+        for value in values:
+            if not isinstance(value, self.stored_value_type):
+                raise ImproperlyConfigured('value %r of column "%s" of %r can not be stored in %s' %
+                                           (value, self._relation_column, self._relation, self.__class__.__name__))
 
     def to_python(self, value):
         if self._relation is None:
             # emulate default behaviour for migrations
-            return super(RelationIntegerField, self).to_python(value)
+            return super(RelationFieldMixin, self).to_python(value)
 
         if value is None:
             return None
@@ -48,24 +163,66 @@ class RelationIntegerField(models.IntegerField):
             else:
                 raise ValidationError('record %r is not from %r' % (value, self._relation))
 
-        if isinstance(value, str) and '.' in value:
-            relation_name, primary_name = value.split('.')
-
-            if relation_name != self._relation.__name__:
-                raise ValidationError('wrong relation name "%s", expected "%s"' % (relation_name, self._relation.__name__))
+        # stored values are checked first, since string stored values can contain dots
+        try:
+            return self._db_values_index[value]
+        except (KeyError, TypeError):
+            pass
 
-            return getattr(self._relation, primary_name)
+        if isinstance(value, str) and '.' in value:
+            return self._get_record_by_name(value)
 
         try:
-            return getattr(self._relation, 'index_%s' % self._relation_column)[int(value)]
+            return getattr(self._relation, 'index_%s' % self._relation_column)[self.stored_value_type(value)]
         except ValueError:
             raise ValidationError('can not convert %r to %r' % (value, self._relation))
 
+    @functional.cached_property
+    def _db_values_index(self):
+        '''
+        stored value -> record, resolved once per field
+        '''
+        if self._relation is None:
+            return {}
+
+        return getattr(self._relation, 'index_%s' % self._relation_column)
+
+    @functional.cached_property
+    def _records_db_values(self):
+        '''
+        record -> stored value, records are hashed by identity
+        '''
+        if self._relation is None:
+            return {}
+
+        return dict(zip(self._relation.records, self._relation.column(self._relation_column)))
+
     def get_prep_value(self, value):
+        try:
+            return self._records_db_values[value]
+        except (KeyError, TypeError):
+            # not record of relation or unhashable value
+            pass
+
         if self._relation is None:
             # emulate default behaviour for migrations
-            return super(RelationIntegerField, self).get_prep_value(value)
+            return super(RelationFieldMixin, self).get_prep_value(value)
+
+        return self._prepare_value(value)
+
+    def get_db_prep_save(self, value, connection):
+        # fast path for bulk_create/bulk_update, skips chain of get_db_prep_value/get_prep_value calls
+        try:
+            value = self._records_db_values[value]
+        except (KeyError, TypeError):
+            return super(RelationFieldMixin, self).get_db_prep_save(value, connection)
 
+        return self.adapt_stored_value(value, connection)
+
+    def adapt_stored_value(self, value, connection):
+        return value
+
+    def _prepare_value(self, value):
         if isinstance(value, Record):
             if value._relation == self._relation:
                 return getattr(value, self._relation_column)
@@ -73,33 +230,221 @@ class RelationIntegerField(models.IntegerField):
                 # TODO: change exception type
                 raise ValidationError('record %r is not from %r' % (value, self._relation))
 
+        try:
+            if value in self._db_values_index:
+                return value
+        except TypeError:
+            pass
+
         if isinstance(value, str) and '.' in value:
-            relation_name, primary_name = value.split('.')
+            # TODO: change exception type
+            return getattr(self._get_record_by_name(value), self._relation_column)
 
-            if relation_name != self._relation.__name__:
-                # TODO: change exception type
-                raise ValidationError('wrong relation name "%s", expected "%s"' % (relation_name, self._relation.__name__))
+        return value
 
-            return getattr(getattr(self._relation, primary_name), self._relation_column)
+    def _get_record_by_name(self, value):
+        '''
+        returns record by "Relation.primary" notation
+        '''
+        relation_name, primary_name = value.split('.', 1)
 
-        return value
+        if relation_name != self._relation.__name__:
+            raise ValidationError('wrong relation name "%s", expected "%s"' % (relation_name, self._relation.__name__))
+
+        record = getattr(self._relation, primary_name, None)
+
+        if not isinstance(record, Record) or record._relation != self._relation:
+            raise ValidationError('%r has no record "%s"' % (self._relation, primary_name))
+
+        return record
 
     def from_db_value(self, value, expression, connection):
-        return self.to_python(value)
+        try:
+            return self._db_values_index[value]
+        except (KeyError, TypeError):
+            # values of unexpected types are processed (and errors are raised) by common conversion
+            return self.to_python(value)
+
+    @functional.cached_property
+    def _relation_transforms(self):
+        if self._relation is None:
+            return {}
+
+        return {RELATION_TRANSFORM_PREFIX + column.name: type('RelationColumnTransform',
+                                                             (RelationColumnTransform,),
+                                                             {'lookup_name': RELATION_TRANSFORM_PREFIX + column.name,
+                                                              'column_name': column.name})
+                for column in self._relation._columns}
+
+    def get_transform(self, lookup_name):
+        if lookup_name in self._relation_transforms:
+            return self._relation_transforms[lookup_name]
+
+        return super(RelationFieldMixin, self).get_transform(lookup_name)
 
     def deconstruct(self):
-        name, path, args, kwargs = super(RelationIntegerField, self).deconstruct()
+        name, path, args, kwargs = super(RelationFieldMixin, self).deconstruct()
         if 'choices' in kwargs:
             del kwargs['choices']
         return name, path, args, kwargs
 
-    @functional.cached_property
+    # not cached, since CharField appends MaxLengthValidator to validators list in constructor
+    @property
     def validators(self):
-        validators = super(RelationIntegerField, self).validators
+        validators = super(RelationFieldMixin, self).validators
 
-        # remove unnecessary validators
+        # remove unnecessary validators, they can not process records
         validators = [validator
                       for validator in validators
-                      if not isinstance(validator, (django_validators.MinValueValidator, django_validators.MaxValueValidator))]
+                      if not isinstance(validator, (django_validators.MinValueValidator,
+                                                    django_validators.MaxValueValidator,
+                                                    django_validators.MaxLengthValidator))]
 
         return validators
+
+
+class RelationIntegerFieldMixin(RelationFieldMixin):
+
+    def adapt_stored_value(self, value, connection):
+        # adapt_integerfield_value is added in Django 4.2, stored values are checked on field creation anyway
+        adapt = getattr(connection.ops, 'adapt_integerfield_value', None)
+
+        if adapt is None:
+            return value
+
+        return adapt(value, self.get_internal_type())
+
+    def check_stored_values(self, values, field_kwargs):
+        super(RelationIntegerFieldMixin, self).check_stored_values(values, field_kwargs)
+
+        min_value, max_value = BaseDatabaseOperations.integer_field_ranges[self.get_internal_type()]
+
+        for value in values:
+            if not min_value <= value <= max_value:
+                raise ImproperlyConfigured('value %r of column "%s" of %r does not fit into %s range [%d, %d]' %
+                                           (value, self._relation_column, self._relation, self.__class__.__name__, min_value, max_value))
+
+
+class RelationIntegerField(RelationIntegerFieldMixin, models.IntegerField):
+    pass
+
+
+class RelationSmallIntegerField(RelationIntegerFieldMixin, models.SmallIntegerField):
+    pass
+
+
+class RelationBigIntegerField(RelationIntegerFieldMixin, models.BigIntegerField):
+    pass
+
+
+class RelationCharField(RelationFieldMixin, models.CharField):
+    '''
+    if max_length is not specified, it is equal to length of the longest stored value
+    '''
+    stored_value_type = str
+
+    def check_stored_values(self, values, field_kwargs):
+        super(RelationCharField, self).check_stored_values(values, field_kwargs)
+
+        if field_kwargs.get('max_length') is None:
+            field_kwargs['max_length'] = max((len(value) for value in values), default=1)
+
+        for value in values:
+            if len(value) > field_kwargs['max_length']:
+                raise ImproperlyConfigured('value %r of column "%s" of %r is longer than max_length %d of %s' %
+                                           (value, self._relation_column, self._relation, field_kwargs['max_length'], self.__class__.__name__))
+
+
+class RecordSetLookup(django_lookups.Lookup):
+    '''
+    bitwise check of stored mask, rhs is RecordSet or iterable of records
+    '''
+
+    def get_masked_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return connection.ops.combine_expression('&', [lhs, rhs]), list(lhs_params) + list(rhs_params), rhs, list(rhs_params)
+
+
+class RecordSetHasAny(RecordSetLookup):
+    lookup_name = 'has_any'
+
+    def as_sql(self, compiler, connection):
+        masked, params, mask, mask_params = self.get_masked_sql(compiler, connection)
+        return '%s != 0' % masked, params
+
+
+class RecordSetHasAll(RecordSetLookup):
+    lookup_name = 'has_all'
+
+    def as_sql(self, compiler, connection):
+        masked, params, mask, mask_params = self.get_masked_sql(compiler, connection)
+        return '%s = %s' % (masked, mask), params + mask_params
+
+
+class RelationSetField(models.BigIntegerField):
+    '''
+    stores set of records as bitmask over records ordinals, values are decoded into RecordSet
+
+    relation must have no more records, than bits in signed bigint (without sign bit)
+    '''
+    MAX_RECORDS = 63
+
+    def __init__(self, *argv, **kwargs):
+        self._relation = kwargs.pop('relation', None)
+
+        if self._relation is not None and len(self._relation.records) > self.MAX_RECORDS:
+            raise ImproperlyConfigured('%r has %d records, but %s can store only %d' %
+                                       (self._relation, len(self._relation.records), self.__class__.__name__, self.MAX_RECORDS))
+
+        super(RelationSetField, self).__init__(*argv, **kwargs)
+
+    def to_python(self, value):
+        if self._relation is None:
+            # emulate default behaviour for migrations
+            return super(RelationSetField, self).to_python(value)
+
+        if value is None:
+            return None
+
+        if isinstance(value, RecordSet):
+            if value.relation is not self._relation:
+                raise ValidationError('record set %r is not from %r' % (value, self._relation))
+            return value
+
+        try:
+            if isinstance(value, (int, str)):
+                return RecordSet.from_mask(self._relation, int(value))
+
+            return RecordSet(self._relation, value)
+
+        except (ValueError, TypeError, exceptions.RelationException):
+            raise ValidationError('can not convert %r to set of %r records' % (value, self._relation))
+
+    def get_prep_value(self, value):
+        if isinstance(value, RecordSet) and value.relation is self._relation:
+            return value.mask
+
+        if self._relation is None or value is None or hasattr(value, 'resolve_expression'):
+            return super(RelationSetField, self).get_prep_value(value)
+
+        return self.to_python(value).mask
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or self._relation is None:
+            # relation is not passed to fields of historical models in migrations
+            return value
+
+        return RecordSet.from_mask(self._relation, value)
+
+    # values are sets, so range validators of BigIntegerField are not applicable
+    @property
+    def validators(self):
+        return [validator
+                for validator in super(RelationSetField, self).validators
+                if not isinstance(validator, (django_validators.MinValueValidator,
+                                              django_validators.MaxValueValidator))]
+
+
+RelationSetField.register_lookup(RecordSetHasAny)
+RelationSetField.register_lookup(RecordSetHasAll)
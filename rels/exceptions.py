@@ -61,11 +61,213 @@ class IndexDuplicatesRelationAttributeError(RelationException):
                    % (index_name, column_name))
         super(IndexDuplicatesRelationAttributeError, self).__init__(message)
 
+class WrongIndexColumnError(RelationException):
+    def __init__(self, index_name, column_name):
+        message = 'Index "%s" refers to unknown column "%s"' % (index_name, column_name)
+        super(WrongIndexColumnError, self).__init__(message)
+
+class DuplicateIndexValueError(RelationException):
+    def __init__(self, index_name, value):
+        message = 'Duplicate value "%s" in index "%s"' % (value, index_name)
+        super(DuplicateIndexValueError, self).__init__(message)
+
+class UnsortableColumnError(ColumnException):
+    def __init__(self, column_name):
+        message = 'values of column "%s" can not be sorted' % column_name
+        super(UnsortableColumnError, self).__init__(message)
+
+class WrongSamplingWeightError(ColumnException):
+    def __init__(self, column_name, value):
+        message = 'value %r of column "%s" can not be used as sampling weight, weights must be non-negative numbers' % (value, column_name)
+        super(WrongSamplingWeightError, self).__init__(message)
+
+class ZeroSamplingWeightsError(ColumnException):
+    def __init__(self, column_name):
+        message = 'sum of sampling weights in column "%s" must be positive' % column_name
+        super(ZeroSamplingWeightsError, self).__init__(message)
+
+class UnknownColumnError(RelationException):
+    def __init__(self, relation_name, column_name):
+        message = 'relation "%s" has no column "%s"' % (relation_name, column_name)
+        super(UnknownColumnError, self).__init__(message)
+
+class WrongFilterConditionError(RelationException):
+    def __init__(self, relation_name, condition):
+        message = 'wrong filter condition "%s" for relation "%s"' % (condition, relation_name)
+        super(WrongFilterConditionError, self).__init__(message)
+
 class NotExternalValueError(RelationException):
     def __init__(self, id_):
         message = '"%(id)s" is not external value' % {'id': id_}
         super(NotExternalValueError, self).__init__(message)
 
+class NotExternalValuesError(RelationException):
+    MAX_REPORTED_VALUES = 10
+
+    def __init__(self, positions, values):
+        self.positions = positions
+        self.values = values
+
+        message = ('%(number)d values are not external values, positions: %(positions)s, values: %(values)s' %
+                   {'number': len(positions),
+                    'positions': ', '.join(str(position) for position in positions[:self.MAX_REPORTED_VALUES]),
+                    'values': ', '.join(repr(value) for value in values[:self.MAX_REPORTED_VALUES])})
+        super(NotExternalValuesError, self).__init__(message)
+
+class WrongMissingModeError(RelationException):
+    def __init__(self, mode):
+        message = 'wrong mode of processing missing values: "%s"' % mode
+        super(WrongMissingModeError, self).__init__(message)
+
+class WrongRecordSetRecordError(RelationException):
+    def __init__(self, relation, record):
+        message = 'record %r is not from relation "%s"' % (record, relation.__name__)
+        super(WrongRecordSetRecordError, self).__init__(message)
+
+class WrongRecordSetMaskError(RelationException):
+    def __init__(self, relation, mask):
+        message = 'mask %r does not correspond to records of relation "%s"' % (mask, relation.__name__)
+        super(WrongRecordSetMaskError, self).__init__(message)
+
+class WrongRecordSetRelationError(RelationException):
+    def __init__(self, relation, other_relation):
+        message = 'record sets of relations "%s" and "%s" can not be combined' % (relation.__name__, other_relation.__name__)
+        super(WrongRecordSetRelationError, self).__init__(message)
+
+class WrongSubsetDefinitionError(RelationException):
+    def __init__(self, subset_name):
+        message = 'subset "%s" must be defined either by primaries or by predicates and conditions' % subset_name
+        super(WrongSubsetDefinitionError, self).__init__(message)
+
+class UnknownSubsetRecordError(RelationException):
+    def __init__(self, relation_name, subset_name, primary_name):
+        message = 'subset "%s" of relation "%s" contains unknown record "%s"' % (subset_name, relation_name, primary_name)
+        super(UnknownSubsetRecordError, self).__init__(message)
+
+class WrongMappingDefinitionError(RelationException):
+    def __init__(self, source_name, target_name):
+        message = 'mapping of relation "%s" to relation "%s" must be defined either by pairs or by column' % (source_name, target_name)
+        super(WrongMappingDefinitionError, self).__init__(message)
+
+class WrongMappingRecordError(RelationException):
+    def __init__(self, relation, record):
+        message = 'record %r is not from relation "%s"' % (record, relation.__name__)
+        super(WrongMappingRecordError, self).__init__(message)
+
+class DuplicateMappingSourceError(RelationException):
+    def __init__(self, record):
+        message = 'record %r is mapped more than once' % (record,)
+        super(DuplicateMappingSourceError, self).__init__(message)
+
+class NotTotalMappingError(RelationException):
+    def __init__(self, source_name, target_name, records):
+        message = ('mapping of relation "%s" to relation "%s" is not total, records are not mapped: %s' %
+                   (source_name, target_name, ', '.join(repr(record) for record in records)))
+        super(NotTotalMappingError, self).__init__(message)
+
+class NotInjectiveMappingError(RelationException):
+    def __init__(self, source_name, target_name, record):
+        message = ('mapping of relation "%s" to relation "%s" is not injective, record %r is target of several records' %
+                   (source_name, target_name, record))
+        super(NotInjectiveMappingError, self).__init__(message)
+
+class NotSurjectiveMappingError(RelationException):
+    def __init__(self, source_name, target_name, records):
+        message = ('mapping of relation "%s" to relation "%s" is not surjective, records are not targets: %s' %
+                   (source_name, target_name, ', '.join(repr(record) for record in records)))
+        super(NotSurjectiveMappingError, self).__init__(message)
+
+class NotMappedRecordError(RelationException):
+    def __init__(self, record):
+        message = 'record %r is not mapped' % (record,)
+        super(NotMappedRecordError, self).__init__(message)
+
+class NotMappedRecordsError(RelationException):
+    MAX_REPORTED_VALUES = 10
+
+    def __init__(self, positions, records):
+        self.positions = positions
+        self.records = records
+
+        message = ('%(number)d records are not mapped, positions: %(positions)s, records: %(records)s' %
+                   {'number': len(positions),
+                    'positions': ', '.join(str(position) for position in positions[:self.MAX_REPORTED_VALUES]),
+                    'records': ', '.join(repr(record) for record in records[:self.MAX_REPORTED_VALUES])})
+        super(NotMappedRecordsError, self).__init__(message)
+
+class WrongSerializationFormatError(RelationException):
+    def __init__(self, format):
+        message = 'wrong serialization format: "%s"' % format
+        super(WrongSerializationFormatError, self).__init__(message)
+
+class UnsupportedSerializationFormatError(RelationException):
+    def __init__(self, relation_name, format):
+        message = 'records of relation "%s" can not be serialized in format "%s"' % (relation_name, format)
+        super(UnsupportedSerializationFormatError, self).__init__(message)
+
+class DuplicateSerializedValueError(RelationException):
+    def __init__(self, value):
+        message = 'serialized value %r corresponds to more than one record' % (value,)
+        super(DuplicateSerializedValueError, self).__init__(message)
+
+class UnknownSerializedValueError(RelationException):
+    def __init__(self, value):
+        message = 'serialized value %r does not correspond to any record' % (value,)
+        super(UnknownSerializedValueError, self).__init__(message)
+
+class UnknownSerializedValuesError(RelationException):
+    MAX_REPORTED_VALUES = 10
+
+    def __init__(self, positions, values):
+        self.positions = positions
+        self.values = values
+
+        message = ('%(number)d serialized values do not correspond to any record, positions: %(positions)s, values: %(values)s' %
+                   {'number': len(positions),
+                    'positions': ', '.join(str(position) for position in positions[:self.MAX_REPORTED_VALUES]),
+                    'values': ', '.join(repr(value) for value in values[:self.MAX_REPORTED_VALUES])})
+        super(UnknownSerializedValuesError, self).__init__(message)
+
+class RowConversionError(RelationException):
+    def __init__(self, position, column_name, value, error):
+        message = 'can not convert value %r of column "%s" in row %d: %r' % (value, column_name, position, error)
+        super(RowConversionError, self).__init__(message)
+
+class MissedRowValueError(RelationException):
+    def __init__(self, position, column_name):
+        message = 'row %d has no value of column "%s"' % (position, column_name)
+        super(MissedRowValueError, self).__init__(message)
+
+class MissedSourceColumnError(RelationException):
+    def __init__(self, column_name):
+        message = 'source has no column "%s"' % column_name
+        super(MissedSourceColumnError, self).__init__(message)
+
+class RecordsInLoadedRelationError(RelationException):
+    def __init__(self, relation_name):
+        message = 'records of relation "%s" are loaded from source and can not be passed in attributes' % relation_name
+        super(RecordsInLoadedRelationError, self).__init__(message)
+
+class UnsupportedMappedValueError(RelationException):
+    def __init__(self, column_name, value):
+        message = 'value %r of column "%s" can not be stored in mapped file, only int, float and str values are supported' % (value, column_name)
+        super(UnsupportedMappedValueError, self).__init__(message)
+
+class UnsupportedMappedIndexError(RelationException):
+    def __init__(self, index_name):
+        message = 'composite index "%s" can not be stored in mapped file' % index_name
+        super(UnsupportedMappedIndexError, self).__init__(message)
+
+class WrongMappedFileError(RelationException):
+    def __init__(self, path, reason):
+        message = 'wrong mapped file "%s": %s' % (path, reason)
+        super(WrongMappedFileError, self).__init__(message)
+
+class MappedRelationAttributeError(RelationException):
+    def __init__(self, relation_name, attr_name):
+        message = 'attribute "%s" of mapped relation "%s" is not allowed, columns and records are stored in mapped file' % (attr_name, relation_name)
+        super(MappedRelationAttributeError, self).__init__(message)
+
 class MultipleExternalColumnsError(RelationException):
     def __init__(self, external_columns):
         message = ('there are more then 1 external column: %s' %
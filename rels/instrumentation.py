@@ -0,0 +1,283 @@
+# coding: utf-8
+'''
+opt-in instrumentation of relations: build durations, memory estimates and counters of lookups
+
+instrumented implementations of lookups are installed only while instrumentation is enabled,
+so there is no overhead, when it is disabled
+'''
+
+import sys
+import functools
+import collections
+
+from rels import exceptions
+
+
+ENABLED = False
+
+_callbacks = []
+
+_original_call = None
+_original_get_from_name = None
+
+
+class CountingIndex(dict):
+    '''
+    copy of relation index, which counts accesses and misses
+    '''
+    __slots__ = ('original', 'accesses', 'misses')
+
+    def __init__(self, original):
+        super(CountingIndex, self).__init__(original)
+        self.original = original
+        self.accesses = 0
+        self.misses = 0
+
+    def __getitem__(self, key):
+        self.accesses += 1
+
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            self.misses += 1
+            raise
+
+    def get(self, key, default=None):
+        self.accesses += 1
+
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            self.misses += 1
+            return default
+
+    def __contains__(self, key):
+        self.accesses += 1
+
+        if dict.__contains__(self, key):
+            return True
+
+        self.misses += 1
+        return False
+
+
+def get_relation_name(relation):
+    return '%s.%s' % (relation.__module__, relation.__qualname__)
+
+
+def get_relation_stats(relation):
+    # stored in relation class, since it is faster than lookup in weak dictionary,
+    # own dictionary of class is used, so subclasses do not share stats with parents
+    try:
+        return relation.__dict__['_instrumentation_stats']
+    except KeyError:
+        pass
+
+    relation._instrumentation_stats = {'build_duration': None,
+                                       'calls': 0,
+                                       'calls_misses': 0,
+                                       'get_from_name': 0}
+    return relation._instrumentation_stats
+
+
+def add_callback(callback):
+    '''
+    callback(event, relation, value) is called on events:
+    - 'build': relation is created, value — duration in seconds
+    - 'miss': relation is called with unknown external value, value — this value
+    '''
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _callbacks.remove(callback)
+
+
+def notify(event, relation, value):
+    for callback in _callbacks:
+        callback(event, relation, value)
+
+
+def get_indexes_names(relation):
+    names = [column.index_name for column in relation._columns if column.has_index]
+    names.extend(index.index_name for index in relation._indexes)
+    return names
+
+
+def wrap_index(relation, index_name, index):
+    '''
+    returns counting copy of index, which replaces index in relation
+    '''
+    counting_index = CountingIndex(index)
+
+    setattr(relation, index_name, counting_index)
+
+    if relation.__dict__.get('_external_index') is index:
+        relation._external_index = counting_index
+
+    return counting_index
+
+
+def unwrap_index(relation, index_name, counting_index):
+    setattr(relation, index_name, counting_index.original)
+
+    if relation.__dict__.get('_external_index') is counting_index:
+        relation._external_index = counting_index.original
+
+
+def instrument_relation(relation):
+    for index_name in get_indexes_names(relation):
+        index = relation.__dict__.get(index_name)
+
+        # lazy indexes are wrapped when built
+        if isinstance(index, dict) and not isinstance(index, CountingIndex):
+            wrap_index(relation, index_name, index)
+
+
+def uninstrument_relation(relation):
+    for index_name in get_indexes_names(relation):
+        index = relation.__dict__.get(index_name)
+
+        if isinstance(index, CountingIndex):
+            unwrap_index(relation, index_name, index)
+
+
+def on_build(relation, duration):
+    get_relation_stats(relation)['build_duration'] = duration
+    instrument_relation(relation)
+    notify('build', relation, duration)
+
+
+def instrumented_call(relation, id_):
+    stats = get_relation_stats(relation)
+    stats['calls'] += 1
+
+    try:
+        return _original_call(relation, id_)
+    except exceptions.NotExternalValueError:
+        stats['calls_misses'] += 1
+        notify('miss', relation, id_)
+        raise
+
+
+def instrumented_get_from_name(relation, name):
+    get_relation_stats(relation)['get_from_name'] += 1
+    return _original_get_from_name(relation, name)
+
+
+def enable():
+    '''
+    build durations are measured only for relations, created after instrumentation is enabled
+    '''
+    global ENABLED, _original_call, _original_get_from_name
+
+    if ENABLED:
+        return
+
+    # relations module imports this one
+    from rels import relations
+
+    _original_call = relations._RelationMetaclass.__call__
+    _original_get_from_name = relations.Relation.__dict__['get_from_name'].__func__
+
+    relations._RelationMetaclass.__call__ = instrumented_call
+    relations.Relation.get_from_name = classmethod(functools.wraps(_original_get_from_name)(instrumented_get_from_name))
+
+    for relation in relations.iter_relations():
+        instrument_relation(relation)
+
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+
+    if not ENABLED:
+        return
+
+    from rels import relations
+
+    relations._RelationMetaclass.__call__ = _original_call
+    relations.Relation.get_from_name = classmethod(_original_get_from_name)
+
+    for relation in relations.iter_relations():
+        uninstrument_relation(relation)
+
+    ENABLED = False
+
+
+def is_enabled():
+    return ENABLED
+
+
+def reset():
+    from rels import relations
+
+    for relation in relations.iter_relations():
+        if '_instrumentation_stats' in relation.__dict__:
+            del relation._instrumentation_stats
+
+        for index_name in get_indexes_names(relation):
+            index = relation.__dict__.get(index_name)
+
+            if isinstance(index, CountingIndex):
+                index.accesses = 0
+                index.misses = 0
+
+
+def estimate_indexes_memory(relation):
+    size = 0
+
+    for index_name in get_indexes_names(relation):
+        index = relation.__dict__.get(index_name)
+
+        if not isinstance(index, dict):
+            # lazy index is not built yet
+            continue
+
+        size += sys.getsizeof(index.original if isinstance(index, CountingIndex) else index)
+
+        # groups of records of not unique indexes
+        size += sum(sys.getsizeof(group) for group in index.values() if isinstance(group, tuple))
+
+    return size
+
+
+def relation_stats(relation):
+    '''
+    returns snapshot of statistics of relation
+
+    memory estimates contain only sizes of records and indexes objects, but not sizes of values,
+    counters are collected only while instrumentation is enabled
+    '''
+    snapshot = dict(get_relation_stats(relation))
+
+    snapshot['records'] = len(relation.records)
+    snapshot['records_memory'] = None
+
+    # records of mapped relations are not materialized for estimate
+    if isinstance(relation.records, tuple):
+        snapshot['records_memory'] = (sys.getsizeof(relation.records) +
+                                      sum(sys.getsizeof(record) for record in relation.records))
+    snapshot['indexes_memory'] = estimate_indexes_memory(relation)
+
+    snapshot['index_accesses'] = collections.OrderedDict()
+    snapshot['index_misses'] = collections.OrderedDict()
+
+    for index_name in get_indexes_names(relation):
+        index = relation.__dict__.get(index_name)
+
+        if isinstance(index, CountingIndex):
+            snapshot['index_accesses'][index_name] = index.accesses
+            snapshot['index_misses'][index_name] = index.misses
+
+    return snapshot
+
+
+def stats():
+    '''
+    returns snapshots of statistics of all relations: {<module>.<relation qualname>: {...}}
+    '''
+    from rels import relations
+
+    return {get_relation_name(relation): relation_stats(relation) for relation in relations.iter_relations()}
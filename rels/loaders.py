@@ -0,0 +1,229 @@
+# coding: utf-8
+'''
+creation of relations from streams of rows: any iterables, CSV and JSON Lines files
+
+rows are converted on the fly and records are created directly from the stream, without intermediate lists
+'''
+
+import sys
+import csv
+import json
+import collections.abc
+
+from rels import exceptions
+from rels.relations import Column, Relation
+
+
+def get_caller_module(depth=2):
+    # as in collections.namedtuple, so records of created relation can be pickled
+    try:
+        return sys._getframe(depth).f_globals.get('__name__', '__main__')
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_columns_names(bases, attributes):
+    columns = {name: column for name, column in attributes.items() if isinstance(column, Column)}
+
+    for base in bases:
+        for column in getattr(base, '_columns', ()):
+            columns.setdefault(column.name, column)
+
+    return [name for name, column in sorted(columns.items(), key=lambda item: item[1]._creation_order)]
+
+
+def get_row_converter(relation_name, columns_names, converters=None, positions=None):
+    '''
+    compiles function, which selects values of columns from row by positions and applies converters in single call,
+    returns None, if rows can be used as is
+    '''
+    converters = converters or {}
+
+    for column_name in converters:
+        if column_name not in columns_names:
+            raise exceptions.UnknownColumnError(relation_name, column_name)
+
+    if positions is None:
+        if not converters:
+            return None
+        positions = range(len(columns_names))
+
+    namespace = {}
+    values = []
+
+    for column_name, position in zip(columns_names, positions):
+        if column_name in converters:
+            namespace['_converter_%d' % position] = converters[column_name]
+            values.append('_converter_%d(row[%d])' % (position, position))
+        else:
+            values.append('row[%d]' % position)
+
+    exec('def convert(row): return (%s,)' % ', '.join(values) if values else 'def convert(row): return ()', namespace)
+
+    return namespace['convert']
+
+
+def get_conversion_error(position, columns_names, converters, row):
+    # column is searched only in case of error, so conversion of correct rows is not slowed down
+    for column_name, value in zip(columns_names, row):
+        if column_name not in converters:
+            continue
+
+        try:
+            converters[column_name](value)
+        except Exception as e:
+            return exceptions.RowConversionError(position, column_name, value, e)
+
+    return None
+
+
+def iter_records(relation_name, rows, columns_names, converters=None, positions=None):
+    '''
+    rows are sequences of values in columns order (or in positions, if specified) or mappings {column name: value}
+    '''
+    convert_sequence = get_row_converter(relation_name, columns_names, converters, positions)
+    convert_mapping = convert_sequence if positions is None else get_row_converter(relation_name, columns_names, converters)
+
+    columns_number = len(columns_names)
+
+    # rows with positions must contain value in the last position
+    min_row_length = max(positions, default=-1) + 1 if positions is not None else 0
+
+    for position, row in enumerate(rows):
+        convert = convert_sequence
+        values_positions = positions
+
+        if isinstance(row, collections.abc.Mapping):
+            try:
+                row = [row[name] for name in columns_names]
+            except KeyError as e:
+                raise exceptions.MissedRowValueError(position, e.args[0])
+
+            convert = convert_mapping
+            values_positions = None
+
+        if values_positions is not None and len(row) < min_row_length:
+            raise exceptions.MissedRowValueError(position, next(name
+                                                                for name, column_position in zip(columns_names, values_positions)
+                                                                if column_position >= len(row)))
+
+        if convert is None or (values_positions is None and len(row) != columns_number):
+            # rows with wrong number of values are reported by relation
+            yield tuple(row)
+            continue
+
+        try:
+            yield convert(row)
+        except Exception:
+            if values_positions is not None:
+                row = [row[column_position] for column_position in values_positions]
+
+            error = get_conversion_error(position, columns_names, converters, row)
+
+            if error is None:
+                raise
+
+            raise error
+
+
+def from_rows(name, rows, bases=(Relation,), attributes=None, converters=None, lazy_indexes=None, module=None, positions=None):
+    '''
+    creates Relation subclass with records from rows — any iterable (for example, generator or database cursor)
+
+    columns are taken from bases (which usually have no records) and attributes,
+    converters — dictionary {column name: callable}, which converts raw values (for example, strings from CSV),
+    positions — positions of columns values in rows, if rows contain values not in columns order
+    '''
+    attributes = dict(attributes or {})
+
+    if 'records' in attributes:
+        raise exceptions.RecordsInLoadedRelationError(name)
+
+    attributes['records'] = iter_records(name, rows, get_columns_names(bases, attributes), converters, positions)
+    attributes['__module__'] = module if module is not None else get_caller_module()
+    attributes['__qualname__'] = name
+
+    metaclass = type(bases[0])
+
+    if lazy_indexes is None:
+        return metaclass(name, bases, attributes)
+
+    return metaclass(name, bases, attributes, lazy_indexes=lazy_indexes)
+
+
+def read_csv(csv_file, columns_names, header, reader_options):
+    '''
+    returns rows and positions of columns values in them
+    '''
+    # empty lines are skipped, as in csv.DictReader
+    rows = (row for row in csv.reader(csv_file, **reader_options) if row)
+
+    if not header:
+        return rows, None
+
+    header_names = next(rows, None)
+
+    if header_names is None:
+        return iter(()), None
+
+    positions = []
+
+    for column_name in columns_names:
+        if column_name not in header_names:
+            raise exceptions.MissedSourceColumnError(column_name)
+        positions.append(header_names.index(column_name))
+
+    return rows, positions
+
+
+def from_csv(name, source, bases=(Relation,), attributes=None, converters=None, lazy_indexes=None, module=None,
+             header=True, encoding='utf-8', **reader_options):
+    '''
+    source — path or file object
+
+    if header is True, the first row contains names of columns (columns can be in any order, extra columns are ignored),
+    otherwise rows contain values in columns order;
+    reader_options are passed to csv.reader
+    '''
+    if module is None:
+        module = get_caller_module()
+
+    columns_names = get_columns_names(bases, attributes or {})
+
+    def create(csv_file):
+        rows, positions = read_csv(csv_file, columns_names, header, reader_options)
+        return from_rows(name, rows, bases=bases, attributes=attributes, converters=converters,
+                         lazy_indexes=lazy_indexes, module=module, positions=positions)
+
+    if hasattr(source, 'read'):
+        return create(source)
+
+    with open(source, newline='', encoding=encoding) as csv_file:
+        return create(csv_file)
+
+
+def iter_jsonl_rows(jsonl_file):
+    for line in jsonl_file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def from_jsonl(name, source, bases=(Relation,), attributes=None, converters=None, lazy_indexes=None, module=None,
+               encoding='utf-8'):
+    '''
+    source — path or file object, every not empty line contains JSON list of values in columns order
+    or JSON object {column name: value}
+    '''
+    if module is None:
+        module = get_caller_module()
+
+    def create(jsonl_file):
+        return from_rows(name, iter_jsonl_rows(jsonl_file),
+                         bases=bases, attributes=attributes, converters=converters,
+                         lazy_indexes=lazy_indexes, module=module)
+
+    if hasattr(source, 'read'):
+        return create(source)
+
+    with open(source, encoding=encoding) as jsonl_file:
+        return create(jsonl_file)
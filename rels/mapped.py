@@ -0,0 +1,608 @@
+# coding: utf-8
+'''
+relations, which records and indexes are stored in memory-mapped file, produced by build step:
+
+    rels.mapped.build(REGION_SOURCE, 'regions.rels')
+
+    class REGION(MappedRelation, path='regions.rels', cache_size=4096):
+        pass
+
+columns are described by file, records are materialized on demand and kept in bounded LRU cache,
+file is mapped read-only, so all processes share the same pages of operating system cache
+'''
+
+import os
+import sys
+import mmap
+import json
+import array
+import bisect
+import struct
+import tempfile
+import functools
+import collections.abc
+
+from rels import exceptions
+from rels import deferred_checks
+from rels.record_set import Subset
+from rels.relations import Column, Index, Record, Relation, SortedIndex, _RelationMetaclass, create_record_class
+
+
+MAGIC = b'RELSMMAP'
+
+# change on every change of file format
+VERSION = 1
+
+DEFAULT_CACHE_SIZE = 4096
+
+# all segments of file are aligned, so arrays can be cast without copying
+ALIGNMENT = 8
+
+HEADER = struct.Struct('<8sQ')
+
+TYPECODES = {int: 'q', float: 'd'}
+
+INT_RANGE = (-2**63, 2**63 - 1)
+
+
+def get_aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def get_ordinals_typecode(records_number):
+    return 'i' if records_number < 2**31 else 'q'
+
+
+def get_value_type(column_name, values):
+    value_type = type(values[0]) if values else int
+
+    for value in values:
+        if type(value) is not value_type or (value_type not in TYPECODES and value_type is not str):
+            raise exceptions.UnsupportedMappedValueError(column_name, value)
+
+    if value_type is int and values:
+        for value in (min(values), max(values)):
+            if not INT_RANGE[0] <= value <= INT_RANGE[1]:
+                raise exceptions.UnsupportedMappedValueError(column_name, value)
+
+    return value_type
+
+
+class FileBuilder(object):
+    '''
+    collects aligned segments of data, references to segments are stored in metadata
+    '''
+    __slots__ = ('segments', 'size')
+
+    def __init__(self):
+        self.segments = []
+        self.size = 0
+
+    def add(self, data, typecode):
+        offset = get_aligned(self.size)
+
+        if offset != self.size:
+            self.segments.append(b'\0' * (offset - self.size))
+
+        data = memoryview(data).cast('B')
+
+        self.segments.append(data)
+        self.size = offset + len(data)
+
+        return {'offset': offset, 'length': len(data) // struct.calcsize(typecode), 'typecode': typecode}
+
+    def add_values(self, values, value_type):
+        if value_type is not str:
+            return self.add(array.array(TYPECODES[value_type], values), TYPECODES[value_type])
+
+        encoded = [value.encode('utf-8') for value in values]
+
+        offsets = array.array('q', [0])
+
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+
+        return {'offsets': self.add(offsets, 'q'),
+                'data': self.add(b''.join(encoded), 'B')}
+
+    def add_index(self, values, value_type):
+        # stable sort, so equal values are ordered by ordinals
+        order = sorted(range(len(values)), key=values.__getitem__)
+
+        return {'keys': self.add_values([values[ordinal] for ordinal in order], value_type),
+                'order': self.add(array.array(get_ordinals_typecode(len(values)), order), get_ordinals_typecode(len(values))),
+                'size': len(set(values))}
+
+
+def build(relation, path):
+    '''
+    writes records and indexes of relation into file for mapped relations
+
+    relation is created as usual, so all its restrictions are checked at build step,
+    values of columns must be int, float or str (one type in column)
+    '''
+    if relation._indexes:
+        raise exceptions.UnsupportedMappedIndexError(relation._indexes[0].index_name)
+
+    builder = FileBuilder()
+
+    columns = []
+
+    for column in relation._columns:
+        values = relation._columns_values[column.name]
+
+        value_type = get_value_type(column.name, values)
+
+        # primary columns are indexed, since records are found by primaries on demand,
+        # sorted keys of index are used by sorted index too
+        index = builder.add_index(values, value_type) if column.has_index or column.primary or column.sorted_index else None
+
+        columns.append({'name': column.name,
+                        'primary': column.primary,
+                        'unique': column.unique,
+                        'external': column.external,
+                        'single_type': column.single_type,
+                        'index_name': column.index_name,
+                        'no_index': column.no_index,
+                        'sorted_index': column.sorted_index,
+                        'sorted_index_name': column.sorted_index_name,
+                        'type': value_type.__name__,
+                        'values': builder.add_values(values, value_type),
+                        'index': index})
+
+    metadata = json.dumps({'version': VERSION,
+                           'byteorder': sys.byteorder,
+                           'records': len(relation.records),
+                           'columns': columns}).encode('utf-8')
+
+    header = HEADER.pack(MAGIC, len(metadata)) + metadata
+    header += b'\0' * (get_aligned(len(header)) - len(header))
+
+    # file is written into temporary file and moved, so processes, which mapped old file, continue to use it
+    directory = os.path.dirname(os.path.abspath(path))
+
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(descriptor, 'wb') as mapped_file:
+            mapped_file.write(header)
+
+            for segment in builder.segments:
+                mapped_file.write(segment)
+
+        # temporary files are readable only by owner, but file is shared by processes of any users
+        os.chmod(temporary_path, 0o644)
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+class StringArray(collections.abc.Sequence):
+    '''
+    read-only sequence of strings, stored as utf-8 data and offsets of values in it
+    '''
+    __slots__ = ('_offsets', '_data')
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(len(self))))
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError('string array index out of range')
+
+        return str(self._data[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+
+    def __iter__(self):
+        data = self._data
+        start = 0
+
+        for end in self._offsets[1:]:
+            yield str(data[start:end], 'utf-8')
+            start = end
+
+    def _bisect(self, value, lo, right):
+        # order of utf-8 bytes is order of strings, so values are compared without decoding
+        if not isinstance(value, str):
+            raise TypeError('string array contains only strings')
+
+        encoded = value.encode('utf-8')
+        offsets = self._offsets
+        data = self._data
+        hi = len(offsets) - 1
+
+        while lo < hi:
+            middle = (lo + hi) // 2
+            middle_value = data[offsets[middle]:offsets[middle + 1]].tobytes()
+
+            if middle_value < encoded or (right and middle_value == encoded):
+                lo = middle + 1
+            else:
+                hi = middle
+
+        return lo
+
+    def bisect_left(self, value, lo=0):
+        return self._bisect(value, lo, right=False)
+
+    def bisect_right(self, value, lo=0):
+        return self._bisect(value, lo, right=True)
+
+
+class MappedFile(object):
+    __slots__ = ('path', 'metadata', '_data')
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as source:
+            try:
+                # mapping stays valid after file is closed
+                mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise exceptions.WrongMappedFileError(path, 'file is empty')
+
+        if len(mapped) < HEADER.size:
+            raise exceptions.WrongMappedFileError(path, 'file is too short')
+
+        magic, metadata_size = HEADER.unpack_from(mapped)
+
+        if magic != MAGIC:
+            raise exceptions.WrongMappedFileError(path, 'file is not produced by rels.mapped.build')
+
+        self.metadata = json.loads(mapped[HEADER.size:HEADER.size + metadata_size].decode('utf-8'))
+
+        if self.metadata['version'] != VERSION:
+            raise exceptions.WrongMappedFileError(path, 'version %r is not supported, rebuild file' % self.metadata['version'])
+
+        if self.metadata['byteorder'] != sys.byteorder:
+            raise exceptions.WrongMappedFileError(path, 'file is built on platform with other byte order')
+
+        self._data = memoryview(mapped)[get_aligned(HEADER.size + metadata_size):]
+
+    def get_array(self, reference):
+        start = reference['offset']
+        stop = start + reference['length'] * struct.calcsize(reference['typecode'])
+        return self._data[start:stop].cast(reference['typecode'])
+
+    def get_values(self, reference):
+        '''
+        returns memoryview for numbers and StringArray for strings
+        '''
+        if 'offsets' in reference:
+            return StringArray(self.get_array(reference['offsets']), self.get_array(reference['data']))
+
+        return self.get_array(reference)
+
+
+class MappedRecord(Record):
+    '''
+    records are materialized on demand and can be evicted from cache,
+    so one record can be represented by different (equal) objects, records must be compared with ==, not with "is"
+    '''
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name.startswith('is_'):
+            return name[3:] in self._primaries or getattr(self._relation, name[3:]) == self
+
+        return getattr(super(), name)
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and self._ordinal == other._ordinal
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.__class__, self._ordinal))
+
+
+def create_records_getter(record_class, columns_values, primaries_values, cache_size):
+    '''
+    returns function, which materializes record by ordinal
+    '''
+    @functools.lru_cache(maxsize=cache_size)
+    def get_record(ordinal):
+        record = record_class(*[values[ordinal] for values in columns_values], ordinal)
+        record._primaries = tuple(values[ordinal] for values in primaries_values)
+        return record
+
+    return get_record
+
+
+class MappedRecords(collections.abc.Sequence):
+    '''
+    replacement of relation records tuple
+    '''
+    __slots__ = ('_get_record', '_size')
+
+    def __init__(self, get_record, size):
+        self._get_record = get_record
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(map(self._get_record, range(*index.indices(self._size))))
+
+        if index < 0:
+            index += self._size
+
+        if not 0 <= index < self._size:
+            raise IndexError('records index out of range')
+
+        return self._get_record(index)
+
+    def __iter__(self):
+        return map(self._get_record, range(self._size))
+
+
+class MappedOrderedRecords(collections.abc.Sequence):
+    '''
+    records in order of sorted values of column
+    '''
+    __slots__ = ('_get_record', '_order')
+
+    def __init__(self, get_record, order):
+        self._get_record = get_record
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(map(self._get_record, self._order[index]))
+
+        return self._get_record(self._order[index])
+
+
+class MappedSortedIndex(SortedIndex):
+    '''
+    replacement of sorted index, keys and order of records are taken from index of column in mapped file
+    '''
+    __slots__ = ()
+
+    def __init__(self, get_record, keys, order):
+        self.keys = keys
+        self.records = MappedOrderedRecords(get_record, order)
+
+
+class MappedIndex(collections.abc.Mapping):
+    '''
+    replacement of index dictionary, keys are found by binary search in sorted values of column,
+    values of not unique index are tuples of records in declaration order
+    '''
+    __slots__ = ('_get_record', '_keys', '_order', '_values', '_unique', '_size', '_bisect_left', '_bisect_right')
+
+    def __init__(self, get_record, keys, order, values, unique, size):
+        self._get_record = get_record
+        self._keys = keys
+        self._order = order
+        self._values = values
+        self._unique = unique
+        self._size = size
+
+        if isinstance(keys, StringArray):
+            self._bisect_left = keys.bisect_left
+            self._bisect_right = keys.bisect_right
+        else:
+            self._bisect_left = functools.partial(bisect.bisect_left, keys)
+            self._bisect_right = functools.partial(bisect.bisect_right, keys)
+
+    def _find(self, key):
+        '''
+        returns bounds of key in sorted keys
+        '''
+        try:
+            start = self._bisect_left(key)
+        except TypeError:
+            # values of other types can not be in column
+            return 0, 0
+
+        if start == len(self._keys) or self._keys[start] != key:
+            return start, start
+
+        if self._unique:
+            return start, start + 1
+
+        return start, self._bisect_right(key, start)
+
+    def __getitem__(self, key):
+        start, stop = self._find(key)
+
+        if start == stop:
+            raise KeyError(key)
+
+        if self._unique:
+            return self._get_record(self._order[start])
+
+        return tuple(map(self._get_record, self._order[start:stop]))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        start, stop = self._find(key)
+        return start != stop
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        # as in dictionaries of usual indexes, keys are iterated in order of first occurrence
+        if self._unique:
+            return iter(self._values)
+
+        return iter(dict.fromkeys(self._values))
+
+
+class _MappedRelationMetaclass(_RelationMetaclass):
+
+    def __new__(cls, name, bases, attributes, path=None, cache_size=None):
+
+        relation_class = type.__new__(cls, name, bases, {})
+
+        if path is None:
+            path = getattr(relation_class, '_path', None)
+
+        if cache_size is None:
+            cache_size = getattr(relation_class, '_cache_size', DEFAULT_CACHE_SIZE)
+
+        relation_attributes = {}
+        subsets = {subset.name: subset for subset in getattr(relation_class, '_subsets', ())}
+
+        for attr_name, attr_value in attributes.items():
+            if attr_name == 'records' or isinstance(attr_value, (Column, Index)):
+                raise exceptions.MappedRelationAttributeError(name, attr_name)
+
+            if isinstance(attr_value, Subset):
+                attr_value.initialize(name=attr_name)
+                subsets[attr_name] = attr_value
+
+            relation_attributes[attr_name] = attr_value
+
+        relation_attributes['_attributes_names'] = frozenset(relation_attributes.keys())
+
+        descriptions = []
+        mapped_file = None
+        records_number = 0
+
+        if path is not None:
+            mapped_file = MappedFile(path)
+            descriptions = mapped_file.metadata['columns']
+            records_number = mapped_file.metadata['records']
+
+        columns = []
+        columns_values = {}
+
+        for description in descriptions:
+            # primary checks are not installed, is_<primary> attributes are resolved on demand
+            column = Column(primary=description['primary'],
+                            unique=description['unique'],
+                            external=description['external'],
+                            single_type=description['single_type'],
+                            index_name=description['index_name'],
+                            no_index=description['no_index'],
+                            sorted_index=description.get('sorted_index', False),
+                            sorted_index_name=description.get('sorted_index_name'))
+            column.initialize(name=description['name'])
+
+            columns.append(column)
+            columns_values[column.name] = mapped_file.get_values(description['values'])
+
+        record_class = create_record_class(columns, relation_class, base=MappedRecord)
+
+        get_record = create_records_getter(record_class,
+                                           [columns_values[column.name] for column in columns],
+                                           [columns_values[column.name] for column in columns if column.primary],
+                                           cache_size)
+
+        relation_attributes['_external_index'] = {}
+
+        primary_indexes = []
+
+        for column, description in zip(columns, descriptions):
+            if description['index'] is None:
+                continue
+
+            index = MappedIndex(get_record,
+                                keys=mapped_file.get_values(description['index']['keys']),
+                                order=mapped_file.get_array(description['index']['order']),
+                                values=columns_values[column.name],
+                                unique=column.unique,
+                                size=description['index']['size'])
+
+            if column.primary:
+                primary_indexes.append((column, index))
+
+            if column.sorted_index:
+                if column.sorted_index_name in relation_attributes:
+                    raise exceptions.IndexDuplicatesRelationAttributeError(column.name, column.sorted_index_name)
+
+                relation_attributes[column.sorted_index_name] = MappedSortedIndex(get_record,
+                                                                                  keys=index._keys,
+                                                                                  order=index._order)
+
+            if not column.has_index:
+                continue
+
+            if column.index_name in relation_attributes:
+                raise exceptions.IndexDuplicatesRelationAttributeError(column.name, column.index_name)
+
+            relation_attributes[column.index_name] = index
+
+            if column.external:
+                relation_attributes['_external_index'] = index
+
+        relation_attributes['records'] = MappedRecords(get_record, records_number)
+        relation_attributes['_record_class'] = record_class
+        relation_attributes['_raw_records'] = ()
+        relation_attributes['_columns'] = columns
+        relation_attributes['_indexes'] = []
+        relation_attributes['_lazy_indexes'] = False
+        relation_attributes['_queries_cache'] = {}
+        relation_attributes['_columns_values'] = columns_values
+        relation_attributes['_projections'] = {}
+        relation_attributes['_samplers'] = {}
+        relation_attributes['_subsets'] = list(subsets.values())
+        relation_attributes['_primary_indexes'] = tuple(index for column, index in primary_indexes)
+        relation_attributes['_path'] = path
+        relation_attributes['_cache_size'] = cache_size
+
+        for attr_name, attr_value in relation_attributes.items():
+            setattr(relation_class, attr_name, attr_value)
+
+        if not deferred_checks.is_enabled():
+            # primaries are not set as attributes, so they are checked against all attributes, including inherited
+            attributes_names = dir(relation_class)
+
+            for column, index in primary_indexes:
+                duplicates = [attr_name for attr_name in attributes_names if attr_name in index]
+
+                if duplicates:
+                    raise exceptions.PrimaryDuplicatesRelationAttributeError(column.name, duplicates)
+
+        for subset in relation_class._subsets:
+            setattr(relation_class, subset.name, subset.get_record_set(relation_class))
+
+        return relation_class
+
+    def __getattr__(cls, name):
+        # called only for not existed attributes, names of internal attributes are never primaries
+        if not name.startswith('_'):
+            for index in cls._primary_indexes:
+                record = index.get(name)
+
+                if record is not None:
+                    return record
+
+        raise AttributeError("type object '%s' has no attribute '%s'" % (cls.__name__, name))
+
+
+class MappedRelation(Relation, metaclass=_MappedRelationMetaclass):
+    '''
+    path and cache_size class keywords (inherited by subclasses):
+
+        class REGION(MappedRelation, path='regions.rels', cache_size=4096):
+            ...
+
+    relation without path has no columns and records
+    '''
@@ -0,0 +1,202 @@
+# coding: utf-8
+'''
+precomputed mappings of records of one relation to records of another:
+
+    STATE_TO_COLOR = Mapping(STATE, COLOR, column='name', bijective=True)
+
+    STATE_TO_COLOR[STATE.ACTIVE]                   # COLOR.ACTIVE
+    STATE_TO_COLOR.inverse[COLOR.ACTIVE]           # STATE.ACTIVE
+    STATE_TO_COLOR.translate(states)               # tuple of colors
+
+mapping is checked on creation and compiled into tuple of target records, indexed by ordinals of source records
+(records can be stored as ordinals, for example, in arrays, and translated by translate_ordinals),
+records are translated by mapping itself — dictionary {source record: target record},
+since hash of record is its identity and dictionary lookup is cheaper than access to ordinal of record
+'''
+
+import itertools
+import collections.abc
+
+from rels import exceptions
+from rels.relations import MISSING, find_duplicate, process_missing
+
+
+class Mapping(dict):
+    __slots__ = ('source', 'target', '_table', '_ordinals', '_inverse')
+
+    def __init__(self, source, target, pairs=None, column=None, target_column=None, total=True, bijective=False):
+        '''
+        mapping is defined either by pairs — iterable of (source record, target record) or dictionary {source record: target record},
+        or by column — records are mapped to records with the same value in target_column (by default, in column with the same name)
+
+        total — every source record must be mapped,
+        bijective — every target record must be mapped from exactly one source record (implies total)
+        '''
+        if (pairs is None) == (column is None):
+            raise exceptions.WrongMappingDefinitionError(source.__name__, target.__name__)
+
+        if column is not None:
+            pairs = get_column_pairs(source, target, column, column if target_column is None else target_column)
+        elif isinstance(pairs, collections.abc.Mapping):
+            pairs = pairs.items()
+
+        table = [None] * len(source.records)
+
+        for source_record, target_record in pairs:
+            check_record(source, source_record)
+            check_record(target, target_record)
+
+            if table[source_record._ordinal] is not None:
+                raise exceptions.DuplicateMappingSourceError(source_record)
+
+            table[source_record._ordinal] = target_record
+
+        self.source = source
+        self.target = target
+        self.set_table(tuple(table))
+
+        if total or bijective:
+            self.check_total()
+
+        if bijective:
+            self.check_injective()
+            self.check_surjective()
+
+    @classmethod
+    def from_table(cls, source, target, table):
+        mapping = dict.__new__(cls)
+        mapping.source = source
+        mapping.target = target
+        mapping.set_table(table)
+        return mapping
+
+    def set_table(self, table):
+        self._table = table
+        self._ordinals = tuple(None if record is None else record._ordinal for record in table)
+        self._inverse = None
+
+        dict.update(self,
+                    ((record, target_record)
+                     for record, target_record in zip(self.source.records, table)
+                     if target_record is not None))
+
+    def check_total(self):
+        missed = [record for record, target_record in zip(self.source.records, self._table) if target_record is None]
+
+        if missed:
+            raise exceptions.NotTotalMappingError(self.source.__name__, self.target.__name__, missed)
+
+    def check_injective(self):
+        duplicate = find_duplicate(target_record for target_record in self._table if target_record is not None)
+
+        if duplicate is not None:
+            raise exceptions.NotInjectiveMappingError(self.source.__name__, self.target.__name__, duplicate)
+
+    def check_surjective(self):
+        targets = set(self._table)
+
+        missed = [record for record in self.target.records if record not in targets]
+
+        if missed:
+            raise exceptions.NotSurjectiveMappingError(self.source.__name__, self.target.__name__, missed)
+
+    @property
+    def inverse(self):
+        '''
+        mapping of target records to source records, exists only for injective mapping
+        '''
+        if self._inverse is None:
+            self.check_injective()
+
+            table = [None] * len(self.target.records)
+
+            for source_record, target_record in zip(self.source.records, self._table):
+                if target_record is not None:
+                    table[target_record._ordinal] = source_record
+
+            self._inverse = self.from_table(self.target, self.source, tuple(table))
+            self._inverse._inverse = self
+
+        return self._inverse
+
+    def __missing__(self, record):
+        # called by dictionary only for records without pair
+        check_record(self.source, record)
+        raise exceptions.NotMappedRecordError(record)
+
+    def get(self, record, default=None):
+        target_record = dict.get(self, record)
+
+        if target_record is None:
+            check_record(self.source, record)
+            return default
+
+        return target_record
+
+    def translate(self, records, missing=MISSING.RAISE, default=None):
+        '''
+        returns tuple of target records for iterable of source records,
+        not mapped records are processed as described in MISSING
+        '''
+        if missing not in MISSING.ALL:
+            raise exceptions.WrongMissingModeError(missing)
+
+        if not isinstance(records, collections.abc.Sequence):
+            records = tuple(records)
+
+        target_records = tuple(map(dict.get, itertools.repeat(self), records))
+
+        # records are always true, so all is faster check of None absence than "in"
+        if all(target_records):
+            return target_records
+
+        # records of other relations are errors in any mode
+        for record, target_record in zip(records, target_records):
+            if target_record is None:
+                check_record(self.source, record)
+
+        return process_missing(target_records, records, missing, default, exceptions.NotMappedRecordsError)
+
+    def translate_ordinals(self, ordinals):
+        '''
+        returns tuple of ordinals of target records (None for not mapped records) for iterable of ordinals of source records
+        '''
+        return tuple(map(self._ordinals.__getitem__, ordinals))
+
+    def __repr__(self):
+        return 'Mapping(%s, %s)' % (self.source.__name__, self.target.__name__)
+
+    def __reduce__(self):
+        return (self.from_table, (self.source, self.target, self._table))
+
+    # mapping is compiled into table, ordinals and inverse mapping on creation, so it can not be changed
+
+    def _readonly(self, *argv, **kwargs):
+        raise TypeError('%r can not be changed' % self)
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    update = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    clear = _readonly
+
+
+def check_record(relation, record):
+    if getattr(record, '_relation', None) is not relation:
+        raise exceptions.WrongMappingRecordError(relation, record)
+
+
+def get_column_pairs(source, target, column, target_column):
+    target_values = target.column(target_column)
+
+    index = dict(zip(target_values, target.records))
+
+    if len(index) != len(target_values):
+        raise exceptions.DuplicateValueError(target_column, find_duplicate(target_values))
+
+    return ((record, index[value])
+            for record, value in zip(source.records, source.column(column))
+            if value in index)
@@ -0,0 +1,209 @@
+# coding: utf-8
+
+import operator
+import collections.abc
+
+from rels import exceptions
+
+
+QUERIES_CACHE_MAX_SIZE = 1024
+
+
+def _contains(value, values):
+    return value in values
+
+
+LOOKUPS = {'exact': operator.eq,
+           'ne': operator.ne,
+           'in': _contains,
+           'gt': operator.gt,
+           'gte': operator.ge,
+           'lt': operator.lt,
+           'lte': operator.le}
+
+
+# arguments of SortedIndex.range for lookups, which can be done by sorted index
+RANGE_LOOKUPS = {'exact': lambda value: {'low': value, 'high': value},
+                 'gt': lambda value: {'low': value, 'include_low': False},
+                 'gte': lambda value: {'low': value},
+                 'lt': lambda value: {'high': value, 'include_high': False},
+                 'lte': lambda value: {'high': value}}
+
+
+class Condition(object):
+    __slots__ = ('column', 'lookup', 'value', '_getter', '_check')
+
+    def __init__(self, relation, key, value):
+        column_name, _, lookup = key.partition('__')
+
+        if not lookup:
+            lookup = 'exact'
+
+        columns = {column.name: column for column in relation._columns}
+
+        if column_name not in columns or lookup not in LOOKUPS:
+            raise exceptions.WrongFilterConditionError(relation.__name__, key)
+
+        if lookup == 'in' and isinstance(value, collections.abc.Iterator):
+            value = tuple(value)
+
+        self.column = columns[column_name]
+        self.lookup = lookup
+        self.value = value
+
+        self._getter = operator.attrgetter(column_name)
+        self._check = LOOKUPS[lookup]
+
+    def check(self, record):
+        return self._check(self._getter(record), self.value)
+
+    def get_candidates(self, relation):
+        '''
+        returns records selected by index in declaration order or None, if there is no suitable index
+        '''
+        if self.column.sorted_index and self.lookup in RANGE_LOOKUPS and (not self.column.has_index or self.lookup != 'exact'):
+            return self.get_range_candidates(relation)
+
+        if not self.column.has_index or self.lookup not in ('exact', 'in'):
+            return None
+
+        index = getattr(relation, self.column.index_name)
+
+        values = (self.value,) if self.lookup == 'exact' else self.value
+
+        candidates = []
+
+        try:
+            for value in values:
+                found = index.get(value)
+
+                if found is None:
+                    continue
+
+                if self.column.unique:
+                    candidates.append(found)
+                else:
+                    candidates.extend(found)
+        except TypeError:
+            # unhashable values can not be found in index
+            return None
+
+        if self.lookup == 'in':
+            candidates = sorted(set(candidates), key=operator.attrgetter('_ordinal'))
+
+        return candidates
+
+    def get_range_candidates(self, relation):
+        index = getattr(relation, self.column.sorted_index_name)
+
+        # None is not limit of range in index, but it is not equal to any value in comparisons
+        if self.value is None:
+            return None
+
+        try:
+            candidates = index.range(**RANGE_LOOKUPS[self.lookup](self.value))
+        except TypeError:
+            # values of other types are compared with records values by checks
+            return None
+
+        return sorted(candidates, key=operator.attrgetter('_ordinal'))
+
+
+def get_conditions(relation, conditions):
+    return [Condition(relation, key, value) for key, value in conditions.items()]
+
+
+def iter_filter_records(relation, predicates, conditions):
+    conditions = get_conditions(relation, conditions)
+
+    records = relation.records
+    rest_conditions = conditions
+
+    for condition in conditions:
+        candidates = condition.get_candidates(relation)
+
+        if candidates is not None and len(candidates) < len(records):
+            records = candidates
+            rest_conditions = [other for other in conditions if other is not condition]
+
+    checks = [condition.check for condition in rest_conditions]
+    checks.extend(predicates)
+
+    return _iter_checked_records(records, checks)
+
+
+def _iter_checked_records(records, checks):
+    for record in records:
+        if all(check(record) for check in checks):
+            yield record
+
+
+def normalize_conditions(conditions):
+    '''
+    iterators of "in" lookups are materialized once, so they can be used both in cache key and in conditions
+    '''
+    for name, value in conditions.items():
+        if name.endswith('__in') and isinstance(value, collections.abc.Iterator):
+            conditions[name] = tuple(value)
+
+
+def get_cache_key(conditions):
+    '''
+    values of "in" lookups are compared by membership, so lists and sets are normalized to hashable containers,
+    values of other lookups are used as is (queries with unhashable values are not memoized)
+    '''
+    key = []
+
+    for name, value in sorted(conditions.items()):
+        if name.endswith('__in'):
+            if isinstance(value, list):
+                value = tuple(value)
+            elif isinstance(value, set):
+                value = frozenset(value)
+
+        key.append((name, value))
+
+    key = tuple(key)
+
+    try:
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
+
+
+def filter_records(relation, predicates, conditions):
+    '''
+    relations are immutable, so results of queries without predicates are memoized per relation
+    '''
+    if predicates:
+        return tuple(iter_filter_records(relation, predicates, conditions))
+
+    normalize_conditions(conditions)
+
+    key = get_cache_key(conditions)
+
+    if key is None:
+        return tuple(iter_filter_records(relation, predicates, conditions))
+
+    cache = relation._queries_cache
+
+    if key not in cache:
+        if len(cache) >= QUERIES_CACHE_MAX_SIZE:
+            cache.clear()
+
+        cache[key] = tuple(iter_filter_records(relation, predicates, conditions))
+
+    return cache[key]
+
+
+def iter_select(relation, field_names):
+    if not field_names:
+        return (() for record in relation.records)
+
+    # columns values are taken from columnar storage, other attributes (like related names) from records
+    return zip(*(relation._columns_values[field_name]
+                 if field_name in relation._columns_values
+                 else map(operator.attrgetter(field_name), relation.records)
+                 for field_name in field_names))
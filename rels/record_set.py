@@ -0,0 +1,251 @@
+# coding: utf-8
+
+from rels import exceptions
+
+
+class RecordSet(frozenset):
+    '''
+    immutable set of records of one relation with integer bitmask over records ordinals
+
+    membership test and set operations are inherited from frozenset, so they are done in C,
+    records hash by identity, which is cheaper than access to their ordinals;
+    mask is used for storage (for example, in database) and for comparison of sets
+    '''
+    __slots__ = ('relation', 'mask')
+
+    def __new__(cls, relation, records=()):
+        records = tuple(records)
+
+        mask = 0
+
+        for record in records:
+            if getattr(record, '_relation', None) is not relation:
+                raise exceptions.WrongRecordSetRecordError(relation, record)
+
+            mask |= 1 << record._ordinal
+
+        return cls._create(relation, records, mask)
+
+    @classmethod
+    def _create(cls, relation, records, mask):
+        record_set = frozenset.__new__(cls, records)
+        record_set.relation = relation
+        record_set.mask = mask
+        return record_set
+
+    @classmethod
+    def from_mask(cls, relation, mask):
+        if mask < 0 or mask >> len(relation.records):
+            raise exceptions.WrongRecordSetMaskError(relation, mask)
+
+        return cls._create(relation, iter_masked_records(relation, mask), mask)
+
+    @classmethod
+    def full(cls, relation):
+        return cls._create(relation, relation.records, (1 << len(relation.records)) - 1)
+
+    def __iter__(self):
+        # records are returned in declaration order
+        return iter_masked_records(self.relation, self.mask)
+
+    def _get_other(self, other):
+        if not isinstance(other, RecordSet):
+            other = RecordSet(self.relation, other)
+
+        elif other.relation is not self.relation:
+            raise exceptions.WrongRecordSetRelationError(self.relation, other.relation)
+
+        return other
+
+    # operations are inlined, since they are often used in hot code
+
+    def __or__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+
+        if other.relation is not self.relation:
+            raise exceptions.WrongRecordSetRelationError(self.relation, other.relation)
+
+        record_set = frozenset.__new__(self.__class__, frozenset.__or__(self, other))
+        record_set.relation = self.relation
+        record_set.mask = self.mask | other.mask
+        return record_set
+
+    def __and__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+
+        if other.relation is not self.relation:
+            raise exceptions.WrongRecordSetRelationError(self.relation, other.relation)
+
+        record_set = frozenset.__new__(self.__class__, frozenset.__and__(self, other))
+        record_set.relation = self.relation
+        record_set.mask = self.mask & other.mask
+        return record_set
+
+    def __sub__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+
+        if other.relation is not self.relation:
+            raise exceptions.WrongRecordSetRelationError(self.relation, other.relation)
+
+        record_set = frozenset.__new__(self.__class__, frozenset.__sub__(self, other))
+        record_set.relation = self.relation
+        record_set.mask = self.mask & ~other.mask
+        return record_set
+
+    def __xor__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+
+        if other.relation is not self.relation:
+            raise exceptions.WrongRecordSetRelationError(self.relation, other.relation)
+
+        record_set = frozenset.__new__(self.__class__, frozenset.__xor__(self, other))
+        record_set.relation = self.relation
+        record_set.mask = self.mask ^ other.mask
+        return record_set
+
+    def union(self, *others):
+        result = self
+
+        for other in others:
+            result = result | self._get_other(other)
+
+        return result
+
+    def intersection(self, *others):
+        result = self
+
+        for other in others:
+            result = result & self._get_other(other)
+
+        return result
+
+    def difference(self, *others):
+        result = self
+
+        for other in others:
+            result = result - self._get_other(other)
+
+        return result
+
+    def symmetric_difference(self, other):
+        return self ^ self._get_other(other)
+
+    def __invert__(self):
+        '''
+        records of relation, which are not in set
+        '''
+        return self.full(self.relation) - self
+
+    def issubset(self, other):
+        other = self._get_other(other)
+        return self.mask & other.mask == self.mask
+
+    def issuperset(self, other):
+        return self._get_other(other).issubset(self)
+
+    def isdisjoint(self, other):
+        return not self.mask & self._get_other(other).mask
+
+    def __le__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+        return self.issubset(other)
+
+    def __lt__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+        return self.issubset(other) and self.mask != other.mask
+
+    def __ge__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+        return self.issuperset(other)
+
+    def __gt__(self, other):
+        if not isinstance(other, RecordSet):
+            return NotImplemented
+        return self.issuperset(other) and self.mask != other.mask
+
+    def __eq__(self, other):
+        return (isinstance(other, RecordSet) and
+                self.relation is other.relation and
+                self.mask == other.mask)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.relation, self.mask))
+
+    def __repr__(self):
+        return 'RecordSet(%s, (%s))' % (self.relation.__name__, ', '.join(repr(record) for record in self))
+
+    def __reduce__(self):
+        return (RecordSet.from_mask, (self.relation, self.mask))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def copy(self):
+        return self
+
+
+def iter_masked_records(relation, mask):
+    records = relation.records
+
+    while mask:
+        lowest_bit = mask & -mask
+        yield records[lowest_bit.bit_length() - 1]
+        mask ^= lowest_bit
+
+
+class Subset(object):
+    '''
+    declaration of named subset of relation records, replaced by RecordSet on relation creation:
+
+        class STATE(Relation):
+            ...
+            TERMINAL = Subset('DONE', 'FAILED')         # records by primaries
+            BILLABLE = Subset(billable=True)            # records by predicates and conditions of Relation.filter
+
+    subsets are inherited and recalculated for records of every subclass
+    '''
+    __slots__ = ('name', 'primaries', 'predicates', 'conditions')
+
+    def __init__(self, *items, **conditions):
+        self.name = None
+        self.primaries = tuple(item for item in items if isinstance(item, str))
+        self.predicates = tuple(item for item in items if not isinstance(item, str))
+        self.conditions = conditions
+
+    def __repr__(self):
+        return 'Subset(name=%r)' % self.name
+
+    def initialize(self, name):
+        self.name = name
+
+        if self.primaries and (self.predicates or self.conditions):
+            raise exceptions.WrongSubsetDefinitionError(name)
+
+    def get_record_set(self, relation):
+        if not self.primaries:
+            return RecordSet(relation, relation.filter(*self.predicates, **self.conditions))
+
+        records = []
+
+        for primary in self.primaries:
+            record = getattr(relation, primary, None)
+
+            if getattr(record, '_relation', None) is not relation:
+                raise exceptions.UnknownSubsetRecordError(relation.__name__, self.name, primary)
+
+            records.append(record)
+
+        return RecordSet(relation, records)
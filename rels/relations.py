@@ -1,16 +1,105 @@
 # coding: utf-8
 
-# TODO: check full mapping of one enum to another (is every value of mapped enum has pair and vice versa)
 # TODO: pep8
 # TODO: pylint
 # TODO: generate docs
 # TODO: rewrite exceptions texts & rename exception classes
-import random
+import time
+import bisect
+import keyword
+import functools
+import operator
+import collections.abc
+import pickle
 
 from rels import exceptions
+from rels import query
+from rels import build_cache
+from rels import deferred_checks
+from rels import instrumentation
+from rels import record_set
+from rels import sampling
+
+def find_duplicate(values):
+    checked_values = set()
+
+    for value in values:
+        if value in checked_values:
+            return value
+
+        checked_values.add(value)
+
+
+def build_index(values, records, unique):
+    '''
+    build index in linear time, unique index can contain less items than records if values are not unique
+    '''
+
+    if unique:
+        return dict(zip(values, records))
+
+    index = {}
+
+    # save declaration order
+    for value, record in zip(values, records):
+        group = index.get(value)
+
+        if group is None:
+            index[value] = [record]
+        else:
+            group.append(record)
+
+    return { k:tuple(v) for k, v in index.items()}
+
+
+class MISSING(object):
+    '''
+    modes of processing unknown values in Relation.from_values
+    '''
+    RAISE = 'raise'
+    DEFAULT = 'default'
+    SKIP = 'skip'
+
+    ALL = (RAISE, DEFAULT, SKIP)
+
+
+def map_records(index, values, missing, default, error_class):
+    '''
+    returns tuple of records for values by unique index, missing values are processed as described in MISSING,
+    error_class receives positions and unknown values
+    '''
+    if missing not in MISSING.ALL:
+        raise exceptions.WrongMissingModeError(missing)
+
+    if not isinstance(values, collections.abc.Sequence):
+        values = tuple(values)
+
+    return process_missing(tuple(map(index.get, values)), values, missing, default, error_class)
+
+
+def process_missing(records, values, missing, default, error_class):
+    '''
+    records — found records for values, None for not found
+    '''
+    if None not in records:
+        return records
+
+    if missing == MISSING.SKIP:
+        return tuple(record for record in records if record is not None)
+
+    if missing == MISSING.DEFAULT:
+        if default is None:
+            return records
+        return tuple(default if record is None else record for record in records)
+
+    positions = [position for position, record in enumerate(records) if record is None]
+
+    raise error_class(positions, [values[position] for position in positions])
+
 
 class Column(object):
-    __slots__ = ('_creation_order', 'primary', 'unique', 'single_type', 'name', 'index_name', 'no_index', 'related_name', 'external', 'primary_checks')
+    __slots__ = ('_creation_order', 'primary', 'unique', 'single_type', 'name', 'index_name', 'no_index', 'related_name', 'external', 'primary_checks',
+                 'sorted_index', 'sorted_index_name')
 
     _creation_counter = 0
 
@@ -23,9 +112,13 @@ class Column(object):
                  index_name=None,
                  no_index=True,
                  related_name=None,
-                 primary_checks=False):
+                 primary_checks=False,
+                 sorted_index=False,
+                 sorted_index_name=None):
         '''
         name usually setupped by Relation class. In constructor it used in tests
+
+        sorted_index — build SortedIndex for range queries, available as sorted_<column name> attribute by default
         '''
         self._creation_order = self.__class__._creation_counter
         self.__class__._creation_counter += 1
@@ -40,6 +133,8 @@ class Column(object):
         self.related_name = related_name
         self.external = external
         self.primary_checks = primary_checks
+        self.sorted_index = sorted_index
+        self.sorted_index_name = sorted_index_name
 
     def __repr__(self):
         repr_str = 'Column(name=%(name)r, unique=%(unique)r, primary=%(primary)r, '\
@@ -52,75 +147,388 @@ class Column(object):
         if self.index_name is None:
             self.index_name = 'index_%s' % self.name
 
+        if self.sorted_index_name is None:
+            self.sorted_index_name = 'sorted_%s' % self.name
+
         if self.primary and not self.unique:
             raise exceptions.PrimaryWithoutUniqueError(self.name)
 
         if self.external and not self.unique:
             raise exceptions.ExternalWithoutUniqueError(self.name)
 
-    def check_uniqueness_restriction(self, records):
-        if not self.unique: return
+    @property
+    def has_index(self):
+        return not self.no_index or self.external
 
-        values = set()
+    def get_values(self, records):
+        return tuple(map(operator.attrgetter(self.name), records))
 
-        for record in records:
-            value = getattr(record, self.name)
+    def check_uniqueness_restriction(self, records, values=None):
+        if not self.unique: return
 
-            if value in values:
-                raise exceptions.DuplicateValueError(self.name, value)
+        if values is None:
+            values = self.get_values(records)
 
-            values.add(value)
+        if len(set(values)) != len(values):
+            raise exceptions.DuplicateValueError(self.name, find_duplicate(values))
 
-    def check_single_type_restriction(self, records):
+    def check_single_type_restriction(self, records, values=None):
         if not self.single_type: return
 
-        if not records: return
+        if values is None:
+            values = self.get_values(records)
 
-        expected_type = getattr(records[0], self.name).__class__
+        if len(set(map(type, values))) > 1:
+            raise exceptions.SingleTypeError(self.name)
 
-        for record in records:
-            value_type = getattr(record, self.name).__class__
-            if expected_type != value_type:
-                raise exceptions.SingleTypeError(self.name)
+    def get_primary_attributes(self, records, values=None):
+        if values is None:
+            values = self.get_values(records)
 
-    def get_primary_attributes(self, records):
-        if not records: return {}
-        return { getattr(record, self.name):record for record in records}
+        return dict(zip(values, records))
 
-    def get_index(self, records):
+    def get_index(self, records, values=None, check=True):
+        '''
+        for unique column also checks uniqueness restriction
+        '''
 
-        index = {}
+        if values is None:
+            values = self.get_values(records)
 
-        if self.unique:
-            for record in records:
-                index[getattr(record, self.name)] = record
-        else:
-            for record in records:
-                value = getattr(record, self.name)
-                # save declaration order
-                index[value] = index.get(value, []) + [record]
+        index = build_index(values, records, self.unique)
+
+        if check and self.unique and len(index) != len(values):
+            raise exceptions.DuplicateValueError(self.name, find_duplicate(values))
+
+        return index
+
+    def get_sorted_index(self, records, values=None):
+        if values is None:
+            values = self.get_values(records)
+
+        try:
+            return SortedIndex(values, records)
+        except TypeError:
+            raise exceptions.UnsortableColumnError(self.name)
+
+    def set_primary_checks(self, record_class, primaries, installed=None, check=True):
+        '''
+        returns tuple of installed primaries names, if installed is passed (from build cache), checks are skipped
+        '''
+        if installed is not None:
+            for id_ in installed:
+                setattr(record_class, 'is_%s' % id_, _PrimaryCheck(primaries[id_]))
+            return installed
+
+        installed = []
+
+        for id_, record in primaries.items():
+            attr_name = 'is_%s' % id_
+
+            if hasattr(record_class, attr_name):
+                if check and self.primary_checks:
+                    raise exceptions.DuplicateIsPrimaryError(record, self, attr_name, id_)
+                # without primary_checks columns and other attributes take precedence
+                continue
+
+            setattr(record_class, attr_name, _PrimaryCheck(record))
+            installed.append(id_)
+
+        return tuple(installed)
+
+    def set_related_names(self, records, values=None):
+        if self.related_name is None:
+            return
+
+        if values is None:
+            values = self.get_values(records)
+
+        for record, value in zip(records, values):
+            try:
+                set_related_name = value.set_related_name
+            except AttributeError:
+                raise exceptions.SetRelatedNameError(value)
+
+            set_related_name(self.related_name, record)
+
+
+class Index(object):
+    '''
+    composite index by several columns, keys of index are tuples of columns values
+    '''
+    __slots__ = ('columns_names', 'unique', 'index_name')
+
+    external = False
+
+    def __init__(self, *columns_names, unique=True, index_name=None):
+        '''
+        index_name usually setupped by Relation class from attribute name
+        '''
+        self.columns_names = columns_names
+        self.unique = bool(unique)
+        self.index_name = index_name
+
+    def __repr__(self):
+        return 'Index(%s, unique=%r, index_name=%r)' % (', '.join(repr(name) for name in self.columns_names),
+                                                        self.unique,
+                                                        self.index_name)
+
+    def initialize(self, index_name):
+        self.index_name = index_name
+
+    def check_columns(self, columns):
+        columns_names = {column.name for column in columns}
+
+        for column_name in self.columns_names:
+            if column_name not in columns_names:
+                raise exceptions.WrongIndexColumnError(self.index_name, column_name)
+
+    def get_values(self, records, columns_values=None):
+        '''
+        columns_values — dictionary {column name: column values}, if values already extracted
+        '''
+        if columns_values is None:
+            columns_values = {name: tuple(map(operator.attrgetter(name), records))
+                              for name in self.columns_names}
+
+        return tuple(zip(*(columns_values[name] for name in self.columns_names)))
+
+    def check_uniqueness_restriction(self, records, values=None):
+        if not self.unique: return
+
+        if values is None:
+            values = self.get_values(records)
+
+        if len(set(values)) != len(values):
+            raise exceptions.DuplicateIndexValueError(self.index_name, find_duplicate(values))
+
+    def get_index(self, records, values=None, check=True):
+        '''
+        for unique index also checks uniqueness restriction
+        '''
+
+        if values is None:
+            values = self.get_values(records)
+
+        index = build_index(values, records, self.unique)
+
+        if check and self.unique and len(index) != len(values):
+            raise exceptions.DuplicateIndexValueError(self.index_name, find_duplicate(values))
+
+        return index
+
+
+class SortedIndex(object):
+    '''
+    records, sorted by values of column (records with equal values are in declaration order),
+    all queries are done by bisection of sorted values
+    '''
+    __slots__ = ('keys', 'records')
+
+    def __init__(self, values, records):
+        order = sorted(range(len(values)), key=values.__getitem__)
+
+        self.keys = tuple(values[ordinal] for ordinal in order)
+        self.records = tuple(records[ordinal] for ordinal in order)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def range(self, low=None, high=None, include_low=True, include_high=True):
+        '''
+        returns tuple of records with values between low and high (None — without limit) in order of values
+        '''
+        start = 0
+        stop = len(self.keys)
+
+        if low is not None:
+            start = (bisect.bisect_left if include_low else bisect.bisect_right)(self.keys, low)
+
+        if high is not None:
+            stop = (bisect.bisect_right if include_high else bisect.bisect_left)(self.keys, high)
+
+        return self.records[start:stop]
+
+    def floor(self, value, default=None):
+        '''
+        returns record with the greatest value, which is less than or equal to value
+        '''
+        position = bisect.bisect_right(self.keys, value)
+        return self.records[position - 1] if position else default
+
+    def lower(self, value, default=None):
+        '''
+        returns record with the greatest value, which is less than value
+        '''
+        position = bisect.bisect_left(self.keys, value)
+        return self.records[position - 1] if position else default
+
+    def ceiling(self, value, default=None):
+        '''
+        returns record with the least value, which is greater than or equal to value
+        '''
+        position = bisect.bisect_left(self.keys, value)
+        return self.records[position] if position < len(self.records) else default
+
+    def higher(self, value, default=None):
+        '''
+        returns record with the least value, which is greater than value
+        '''
+        position = bisect.bisect_right(self.keys, value)
+        return self.records[position] if position < len(self.records) else default
+
+    def top(self, number):
+        '''
+        returns tuple of number records with the greatest values in descending order of values
+        '''
+        if number <= 0:
+            return ()
+
+        return self.records[:-number - 1:-1]
+
+    def bottom(self, number):
+        '''
+        returns tuple of number records with the least values in ascending order of values
+        '''
+        if number <= 0:
+            return ()
+
+        return self.records[:number]
+
+
+_RECORD_CONSTRUCTOR_TEMPLATE = '''
+def __new__(%(arguments)s):
+    _record = _object_new(_cls)
+%(assignments)s
+    _record._primaries = ()
+    _record._ordinal = _ordinal
+    return _record
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def get_record_constructor(names):
+    '''
+    constructors are compiled once for every set of columns names, since many relations have the same columns
+    '''
+    arguments = ['_%d' % i for i in range(len(names))]
+
+    # keywords and not identifiers (for example, "from" or "unit-name") can not be used in attribute assignment
+    assignments = ['    _record.%s = %s' % (name, argument)
+                   if name.isidentifier() and not keyword.iskeyword(name) else
+                   '    _setattr(_record, %r, %s)' % (name, argument)
+                   for name, argument in zip(names, arguments)]
+
+    source = _RECORD_CONSTRUCTOR_TEMPLATE % {'arguments': ', '.join(['_cls'] + arguments + ['_ordinal=None']),
+                                             'assignments': '\n'.join(assignments)}
+    namespace = {'_object_new': object.__new__,
+                 '_setattr': setattr}
+    exec(source, namespace)
+
+    return namespace['__new__']
+
+
+def create_record_class(columns, relation_class=None, base=None):
+    '''
+    create Record subclass (or subclass of base) with slots for every column and with constructor,
+    which accepts column values (and optionally record ordinal) as positional arguments
+    '''
+    names = tuple(column.name for column in columns)
+
+    # names, which are not identifiers, can not be slots, values of such columns are stored in __dict__ of record
+    slots = tuple(name for name in names if name.isidentifier())
+
+    if len(slots) != len(names):
+        slots += ('__dict__',)
+
+    class_name = '%sRecord' % relation_class.__name__ if relation_class is not None else 'Record'
+
+    return type(class_name, (base or Record,), {'__slots__': slots,
+                                        '__new__': get_record_constructor(names),
+                                        '_relation': relation_class})
+
+
+class _PrimaryCheck(object):
+    __slots__ = ('record',)
 
-            index = { k:tuple(v) for k, v in index.items()}
+    def __init__(self, record):
+        self.record = record
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        return instance is self.record
+
+
+class _RelatedName(object):
+    __slots__ = ('name', 'records')
+
+    def __init__(self, name):
+        self.name = name
+        self.records = {}
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        try:
+            return self.records[instance]
+        except KeyError:
+            raise AttributeError(self.name)
+
+
+class _LazyIndex(object):
+    '''
+    build index of column (or Index) on first access and replace itself with it
+    '''
+    __slots__ = ('source',)
+
+    def __init__(self, source):
+        self.source = source
+
+    def __get__(self, instance, owner):
+        index = self.source.get_index(owner.records)
+
+        setattr(owner, self.source.index_name, index)
+
+        if self.source.external:
+            setattr(owner, '_external_index', index)
+
+        if instrumentation.ENABLED:
+            index = instrumentation.wrap_index(owner, self.source.index_name, index)
 
         return index
 
 
 class Record(object):
+    __slots__ = ('_primaries', '_ordinal')
 
-    def __init__(self, columns, data, relation_class=None):
-        self._primaries = []
-        self._relation = relation_class
+    _relation = None
 
+    _generic_classes = {}
+
+    def __new__(cls, columns, data, relation_class=None):
+        '''
+        generic constructor, relations create records with classes from create_record_class
+        '''
         if len(columns) != len(data):
             raise exceptions.ColumnsNumberError(columns, data)
 
-        for column, value in zip(columns, data):
-            setattr(self, column.name, value)
+        key = (tuple(column.name for column in columns), relation_class)
+
+        if key not in cls._generic_classes:
+            cls._generic_classes[key] = create_record_class(columns, relation_class)
+
+        record = cls._generic_classes[key](*data)
+
+        for column in columns:
+            column.set_related_names((record,))
 
-            if column.related_name is not None:
-                if not hasattr(value, 'set_related_name'):
-                    raise exceptions.SetRelatedNameError(value)
-                value.set_related_name(column.related_name, self)
+        return record
 
     def __getattr__(self, name):
         if name.startswith('is_'):
@@ -128,23 +536,27 @@ class Record(object):
 
         return getattr(super(), name)
 
+    @property
+    def ordinal(self):
+        '''
+        stable position of record in relation records
+        '''
+        return self._ordinal
+
     def _add_primary(self, primary_name):
-        self._primaries.append(primary_name)
+        self._primaries += (primary_name,)
 
     def set_related_name(self, name, record):
         if hasattr(self, name):
             raise exceptions.DuplicateRelatonNameError(record, name)
-        setattr(self, name, record)
 
-    def _set_primary_checks(self, column, ids):
-        if not column.primary_checks:
-            return
+        related_name = type(self).__dict__.get(name)
 
-        for id_ in ids:
-            attr_name = 'is_%s' % id_
-            if hasattr(self, attr_name):
-                raise exceptions.DuplicateIsPrimaryError(self, column, attr_name, id_)
-            setattr(self, attr_name, id_ == getattr(self, column.name))
+        if related_name is None:
+            related_name = _RelatedName(name)
+            setattr(type(self), name, related_name)
+
+        related_name.records[self] = record
 
     def __repr__(self):
         relation_name = self._relation.__name__ if self._relation is not None else None
@@ -158,6 +570,43 @@ class Record(object):
     def __deepcopy__(self, memo):
         return self
 
+    def __reduce__(self):
+        '''
+        pickle record as reference to relation and primary (or ordinal), so unpickled record is the same object
+        '''
+        if self._relation is None:
+            raise pickle.PicklingError('record %r does not belong to any relation' % self)
+
+        if self._primaries:
+            return (getattr, (self._relation, self._primaries[0]))
+
+        return (get_record_by_ordinal, (self._relation, self._ordinal))
+
+
+def get_record_by_ordinal(relation, ordinal):
+    return relation.records[ordinal]
+
+
+def iter_relations():
+    '''
+    iterates over all created subclasses of Relation
+    '''
+    queue = [Relation]
+    seen = set()
+
+    while queue:
+        relation = queue.pop()
+
+        if relation in seen:
+            continue
+
+        seen.add(relation)
+        queue.extend(relation.__subclasses__())
+
+        # classes, which construction failed, stay in subclasses until garbage collection
+        if '_columns_values' in relation.__dict__:
+            yield relation
+
 
 class _RelationMetaclass(type):
 
@@ -165,6 +614,8 @@ class _RelationMetaclass(type):
     def process_class_attributes(cls, relation_class, bases, attributes):
         relation_attributes = {}
         columns = {}
+        indexes = {}
+        subsets = {}
         raw_records = []
 
         for attr_name, attr_value in attributes.items():
@@ -173,6 +624,14 @@ class _RelationMetaclass(type):
             elif isinstance(attr_value, Column):
                 attr_value.initialize(name=attr_name)
                 columns[attr_name] = attr_value
+            elif isinstance(attr_value, Index):
+                attr_value.initialize(index_name=attr_name)
+                indexes[attr_name] = attr_value
+            elif isinstance(attr_value, record_set.Subset):
+                # subset is replaced by record set, when relation is created
+                attr_value.initialize(name=attr_name)
+                subsets[attr_name] = attr_value
+                relation_attributes[attr_name] = attr_value
             else:
                 relation_attributes[attr_name] = attr_value
 
@@ -181,8 +640,17 @@ class _RelationMetaclass(type):
                 for column in base._columns:
                     if column.name not in columns:
                         columns[column.name] = column
-            if hasattr(base, '_raw_records'):
-                raw_records = list(base._raw_records) + list(raw_records)
+            if hasattr(base, '_indexes'):
+                for index in base._indexes:
+                    if index.index_name not in indexes:
+                        indexes[index.index_name] = index
+            for subset in getattr(base, '_subsets', ()):
+                subsets.setdefault(subset.name, subset)
+            if getattr(base, '_raw_records', None):
+                raw_records = tuple(base._raw_records) + tuple(raw_records)
+
+        # records can be any iterable (for example, stream of converted rows), tuple is not copied
+        raw_records = tuple(raw_records)
 
         columns = sorted(columns.values(), key=lambda c: c._creation_order)
 
@@ -190,39 +658,121 @@ class _RelationMetaclass(type):
         if len(external_columns) > 1:
             raise exceptions.MultipleExternalColumnsError(external_columns)
 
-        records = [Record(columns, record, relation_class) for record in raw_records]
+        indexes = list(indexes.values())
+
+        for index in indexes:
+            index.check_columns(columns)
+
+        record_class = create_record_class(columns, relation_class)
+
+        columns_number = len(columns)
+
+        records = []
+
+        for ordinal, data in enumerate(raw_records):
+            if len(data) != columns_number:
+                raise exceptions.ColumnsNumberError(columns, data)
+            records.append(record_class(*data, ordinal))
 
         relation_attributes['records'] = tuple(records)
-        relation_attributes['_raw_records'] = tuple(raw_records)
+        relation_attributes['_record_class'] = record_class
+        relation_attributes['_raw_records'] = raw_records
         relation_attributes['_columns'] = columns
+        relation_attributes['_indexes'] = indexes
+        relation_attributes['_subsets'] = list(subsets.values())
         relation_attributes['_external_index'] = {}
 
         return columns, relation_attributes, records
 
-    def __new__(cls, name, bases, attributes):
+    @classmethod
+    def get_columns_values(cls, columns, raw_records):
+        '''
+        transpose raw records in single pass, all checks and indexes work with columns values
+        '''
+        if not raw_records:
+            return [()] * len(columns)
+
+        return list(zip(*raw_records))
+
+    def __new__(cls, name, bases, attributes, lazy_indexes=None):
+
+        started_at = time.perf_counter() if instrumentation.ENABLED else None
 
         relation_class = super(_RelationMetaclass, cls).__new__(cls, name, bases, {})
 
+        if lazy_indexes is None:
+            lazy_indexes = getattr(relation_class, '_lazy_indexes', False)
+
         columns, relation_attributes, records = cls.process_class_attributes(relation_class,
                                                                           bases,
                                                                           attributes)
 
+        cache_key = None
+        snapshot = None
+
+        if build_cache.is_enabled():
+            cache_key = build_cache.get_key(relation_class,
+                                            columns,
+                                            relation_attributes['_indexes'],
+                                            relation_attributes.keys(),
+                                            relation_attributes['_raw_records'],
+                                            lazy_indexes)
+
+            if cache_key is not None:
+                snapshot = build_cache.load(cache_key)
+
+        # snapshot exists only for definitions and records, which passed all checks,
+        # in deferred checks mode data is checked by rels.checker
+        checks = snapshot is None and not deferred_checks.is_enabled()
+
+        if snapshot is None:
+            snapshot = {'primary_checks': {}}
+
+        columns_values = cls.get_columns_values(columns, relation_attributes['_raw_records'])
+
+        for column, values in zip(columns, columns_values):
+            column.set_related_names(records, values)
+
+        columns_values = dict(zip((column.name for column in columns), columns_values))
+
+        indexes = {}
+
         for column in columns:
-            column.check_uniqueness_restriction(records)
-            column.check_single_type_restriction(records)
+            values = columns_values[column.name]
+
+            if checks:
+                column.check_single_type_restriction(records, values)
+
+            if column.has_index and not lazy_indexes:
+                # index checks uniqueness restriction by itself
+                indexes[column.name] = column.get_index(records, values, check=checks)
+            elif checks:
+                column.check_uniqueness_restriction(records, values)
+
+        # used by rels.checker to find collisions of primaries with attributes
+        relation_attributes['_attributes_names'] = frozenset(relation_attributes.keys())
 
         # create primaries
         for column in columns:
             if not column.primary:
                 continue
-            attributes = column.get_primary_attributes(records)
 
-            duplicates = list(set(attributes.keys()) & set(relation_attributes.keys()))
-            if duplicates:
-                raise exceptions.PrimaryDuplicatesRelationAttributeError(duplicates, column.name)
+            values = columns_values[column.name]
+
+            if column.name in indexes:
+                attributes = indexes[column.name]
+            else:
+                attributes = column.get_primary_attributes(records, values)
+
+            if checks:
+                duplicates = list(set(attributes.keys()) & set(relation_attributes.keys()))
+                if duplicates:
+                    raise exceptions.PrimaryDuplicatesRelationAttributeError(column.name, duplicates)
 
-            for record in records:
-                record._set_primary_checks(column, list(attributes.keys()))
+            snapshot['primary_checks'][column.name] = column.set_primary_checks(relation_attributes['_record_class'],
+                                                                                attributes,
+                                                                                installed=snapshot['primary_checks'].get(column.name),
+                                                                                check=checks)
 
             for attr_name, record in attributes.items():
                 record._add_primary(attr_name)
@@ -231,28 +781,71 @@ class _RelationMetaclass(type):
 
         # create indexes
         for column in columns:
-            index = None
+            if not column.has_index:
+                continue
+
+            if column.index_name in relation_attributes:
+                raise exceptions.IndexDuplicatesRelationAttributeError(column.name, column.index_name)
+
+            index = _LazyIndex(column) if lazy_indexes else indexes[column.name]
+
+            relation_attributes[column.index_name] = index
+
+            if column.external:
+                relation_attributes['_external_index'] = index
+
+        # create sorted indexes
+        for column in columns:
+            if not column.sorted_index:
+                continue
+
+            if column.sorted_index_name in relation_attributes:
+                raise exceptions.IndexDuplicatesRelationAttributeError(column.name, column.sorted_index_name)
+
+            relation_attributes[column.sorted_index_name] = column.get_sorted_index(records, columns_values[column.name])
+
+        # create composite indexes
 
-            if not column.no_index or column.external:
-                index = column.get_index(records)
+        for index in relation_attributes['_indexes']:
+            if index.index_name in relation_attributes:
+                raise exceptions.IndexDuplicatesRelationAttributeError(', '.join(index.columns_names), index.index_name)
 
-                if column.index_name in relation_attributes:
-                    raise exceptions.IndexDuplicatesRelationAttributeError(column.name, column.index_name)
+            if not lazy_indexes:
+                relation_attributes[index.index_name] = index.get_index(records, index.get_values(records, columns_values), check=checks)
+                continue
+
+            if index.unique and checks:
+                index.check_uniqueness_restriction(records, index.get_values(records, columns_values))
 
-                relation_attributes[column.index_name] = index
+            relation_attributes[index.index_name] = _LazyIndex(index)
 
-                if column.external:
-                    relation_attributes['_external_index'] = index
+        relation_attributes['_lazy_indexes'] = lazy_indexes
+        relation_attributes['_queries_cache'] = {}
+        relation_attributes['_columns_values'] = columns_values
+        relation_attributes['_projections'] = {}
+        relation_attributes['_samplers'] = {}
 
         for attr_name, attr_value in relation_attributes.items():
             setattr(relation_class, attr_name, attr_value)
 
+        # subsets are calculated for complete relation, since they can be selected by queries
+        for subset in relation_class._subsets:
+            setattr(relation_class, subset.name, subset.get_record_set(relation_class))
+
+        if cache_key is not None and checks:
+            build_cache.save(cache_key, snapshot)
+
+        if started_at is not None:
+            instrumentation.on_build(relation_class, time.perf_counter() - started_at)
+
         return relation_class
 
     def __call__(self, id_):
-        if id_ not in self._external_index:
-            raise exceptions.NotExternalValueError(id_)
-        return self._external_index[id_]
+        # single lookup, dictionary with integer keys is not slower than direct sequence indexing
+        try:
+            return self._external_index[id_]
+        except KeyError:
+            raise exceptions.NotExternalValueError(id_) from None
 
     def __copy__(self):
         return self
@@ -263,18 +856,109 @@ class _RelationMetaclass(type):
 
 
 class Relation(object, metaclass=_RelationMetaclass):
+    '''
+    lazy_indexes class keyword (inherited by subclasses) enables indexes building on first access:
+
+        class ENUM(Relation, lazy_indexes=True):
+            ...
+    '''
 
     @classmethod
     def select(cls, *field_names):
-        result = []
-        for record in cls.records:
-            row = tuple(getattr(record, field_name) for field_name in field_names)
-            result.append(row)
-        return tuple(result)
+        return tuple(query.iter_select(cls, field_names))
+
+    @classmethod
+    def iter_select(cls, *field_names):
+        return query.iter_select(cls, field_names)
+
+    @classmethod
+    def column(cls, column_name):
+        '''
+        returns tuple of column values, value of record is placed at record.ordinal position
+        '''
+        if column_name not in cls._columns_values:
+            raise exceptions.UnknownColumnError(cls.__name__, column_name)
+
+        return cls._columns_values[column_name]
+
+    @classmethod
+    def projection(cls, source_column_name, target_column_name):
+        '''
+        returns dictionary {value of source column: value of target column in the same record},
+        source column must be unique
+        '''
+        key = (source_column_name, target_column_name)
+
+        if key not in cls._projections:
+            source_values = cls.column(source_column_name)
+            target_values = cls.column(target_column_name)
+
+            projection = dict(zip(source_values, target_values))
+
+            if len(projection) != len(source_values):
+                raise exceptions.DuplicateValueError(source_column_name, find_duplicate(source_values))
+
+            cls._projections[key] = projection
+
+        return cls._projections[key]
+
+    @classmethod
+    def filter(cls, *predicates, **conditions):
+        '''
+        conditions: <column>=value or <column>__<lookup>=value, where lookup is one of: exact, ne, in, gt, gte, lt, lte
+        predicates: callables, which receive record
+
+        returns tuple of records in declaration order
+        '''
+        return query.filter_records(cls, predicates, conditions)
+
+    @classmethod
+    def where(cls, *predicates, **conditions):
+        '''
+        streaming version of filter
+        '''
+        return query.iter_filter_records(cls, predicates, conditions)
+
+    @classmethod
+    def sampler(cls, weight=None):
+        '''
+        returns precomputed sampler of records, weighted by values of numeric column weight (uniform if None)
+        '''
+        if weight not in cls._samplers:
+            cls._samplers[weight] = sampling.Sampler(cls.records,
+                                                     None if weight is None else cls.column(weight),
+                                                     weight)
+
+        return cls._samplers[weight]
+
+    @classmethod
+    def random(cls, exclude=(), weight=None, rng=None):
+        '''
+        returns random record, which is not in exclude
+
+        weight: name of numeric column with sampling weights of records
+        rng: object with interface of random.Random, by default functions of random module are used
+        '''
+        return cls.sampler(weight).choice(exclude, rng)
+
+    @classmethod
+    def sample(cls, k, replace=False, exclude=(), weight=None, rng=None):
+        '''
+        returns tuple of k random records, with replace=False records are not repeated
+        '''
+        return cls.sampler(weight).sample(k, replace, exclude, rng)
 
     @classmethod
-    def random(cls, exclude=()):
-        return random.choice([record for record in cls.records if record not in exclude])
+    def from_values(cls, values, missing=MISSING.RAISE, default=None):
+        '''
+        returns tuple of records for iterable (or array, or memoryview) of external values
+
+        missing — how to process unknown values:
+        - MISSING.RAISE: raise NotExternalValuesError with positions of all unknown values
+        - MISSING.DEFAULT: place default value instead of record
+        - MISSING.SKIP: skip unknown values
+        '''
+        return map_records(cls._external_index, values, missing, default, exceptions.NotExternalValuesError)
 
     @classmethod
     def get_from_name(cls, name):
@@ -0,0 +1,207 @@
+# coding: utf-8
+'''
+precomputed structures for random sampling of relation records:
+
+    STATE.random()                                          # uniform choice
+    STATE.random(weight='frequency')                        # choice weighted by values of numeric column
+    STATE.sample(3, weight='frequency', rng=random.Random(42))
+
+sampler is built once per relation and weight column, so records list is not rebuilt on every call;
+weighted choice uses alias table (Vose's method) and takes constant time;
+excluded records are rejected and drawn again, if rejections repeat, sampling falls back to sampler of not excluded records
+
+rng is any object with interface of random.Random, by default functions of random module are used
+'''
+
+import math
+import heapq
+import random
+import collections.abc
+
+from rels import exceptions
+
+
+MAX_REJECTIONS = 16
+
+
+class Sampler(object):
+    __slots__ = ('records', 'weights', 'column_name', 'population', '_probabilities', '_aliases')
+
+    def __init__(self, records, weights=None, column_name=None):
+        self.records = records
+        self.weights = weights
+        self.column_name = column_name
+        self._probabilities = None
+        self._aliases = None
+
+        # number of records, which can be sampled
+        self.population = len(records)
+
+        if weights is not None:
+            self._probabilities, self._aliases = build_alias_table(weights, column_name)
+            self.population = sum(1 for weight in weights if weight > 0)
+
+    def __repr__(self):
+        return 'Sampler(records=%d, weight=%r)' % (len(self.records), self.column_name)
+
+    def _draw(self, rng):
+        if self._aliases is None:
+            return rng.choice(self.records)
+
+        position = rng.random() * len(self._aliases)
+        index = int(position)
+
+        if position - index >= self._probabilities[index]:
+            index = self._aliases[index]
+
+        return self.records[index]
+
+    def _draw_not_excluded(self, exclude, rng):
+        for _ in range(MAX_REJECTIONS):
+            record = self._draw(rng)
+
+            if record not in exclude:
+                return record
+
+        return None
+
+    def restrict(self, exclude):
+        '''
+        returns sampler of not excluded records
+        '''
+        exclude = get_excluded(exclude)
+
+        positions = [index for index, record in enumerate(self.records) if record not in exclude]
+
+        records = tuple(self.records[index] for index in positions)
+
+        if self.weights is None:
+            return Sampler(records)
+
+        return Sampler(records, tuple(self.weights[index] for index in positions), self.column_name)
+
+    def choice(self, exclude=(), rng=None):
+        if rng is None:
+            rng = random
+
+        if not exclude:
+            return self._draw(rng)
+
+        exclude = get_excluded(exclude)
+
+        record = self._draw_not_excluded(exclude, rng)
+
+        if record is None:
+            return self.restrict(exclude)._draw(rng)
+
+        return record
+
+    def sample(self, k, replace=False, exclude=(), rng=None):
+        '''
+        returns tuple of k records, with replace=False records are not repeated
+        '''
+        if rng is None:
+            rng = random
+
+        if exclude:
+            exclude = get_excluded(exclude)
+
+        if not replace:
+            sampler = self.restrict(exclude) if exclude else self
+            return sampler._sample_unique(k, rng)
+
+        if not exclude:
+            if self._aliases is None:
+                return tuple(rng.choices(self.records, k=k))
+
+            return tuple(self._draw(rng) for _ in range(k))
+
+        records = []
+
+        sampler = self
+
+        for _ in range(k):
+            record = sampler._draw_not_excluded(exclude, rng) if sampler is self else sampler._draw(rng)
+
+            if record is None:
+                sampler = self.restrict(exclude)
+                record = sampler._draw(rng)
+
+            records.append(record)
+
+        return tuple(records)
+
+    def _sample_unique(self, k, rng):
+        if self._aliases is None:
+            return tuple(rng.sample(self.records, k))
+
+        if not 0 <= k <= self.population:
+            raise ValueError('Sample larger than population or is negative')
+
+        # successive weighted draws, already chosen records are rejected
+        chosen = {}
+
+        for _ in range(MAX_REJECTIONS * k):
+            if len(chosen) == k:
+                break
+
+            chosen[self._draw(rng)] = None
+
+        if len(chosen) == k:
+            return tuple(chosen)
+
+        # rejections repeat, remaining records are sampled from not chosen ones
+        return tuple(chosen) + self.restrict(chosen.keys())._sample_all_weighted(k - len(chosen), rng)
+
+    def _sample_all_weighted(self, k, rng):
+        # Efraimidis-Spirakis method: every record gets key log(u) / weight, records with k largest keys form sample
+        keys = [(math.log(1.0 - rng.random()) / weight, index)
+                for index, weight in enumerate(self.weights)
+                if weight > 0]
+
+        return tuple(self.records[index] for key, index in heapq.nlargest(k, keys))
+
+
+def get_excluded(exclude):
+    # membership test in set does not depend on number of excluded records
+    if isinstance(exclude, collections.abc.Set):
+        return exclude
+
+    return frozenset(exclude)
+
+
+def build_alias_table(weights, column_name):
+    for weight in weights:
+        if not isinstance(weight, (int, float)) or not math.isfinite(weight) or weight < 0:
+            raise exceptions.WrongSamplingWeightError(column_name, weight)
+
+    total = math.fsum(weights)
+
+    if total <= 0:
+        raise exceptions.ZeroSamplingWeightsError(column_name)
+
+    size = len(weights)
+
+    probabilities = [weight * size / total for weight in weights]
+    aliases = list(range(size))
+
+    small = [index for index, probability in enumerate(probabilities) if probability < 1.0]
+    large = [index for index, probability in enumerate(probabilities) if probability >= 1.0]
+
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+
+        aliases[less] = more
+        probabilities[more] -= 1.0 - probabilities[less]
+
+        if probabilities[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+
+    # remaining probabilities differ from 1 only by rounding errors
+    for index in small + large:
+        probabilities[index] = 1.0
+
+    return tuple(probabilities), tuple(aliases)
@@ -0,0 +1,148 @@
+# coding: utf-8
+
+import json
+import functools
+
+from rels import exceptions
+from rels.relations import Record, MISSING, map_records
+from rels.record_set import RecordSet
+
+
+class FORMAT(object):
+    '''
+    formats of serialized records
+    '''
+    EXTERNAL = 'external' # value of external column
+    PRIMARY = 'primary'   # name of the first primary
+    FULL = 'full'         # "<relation name>.<primary name>", as in repr and Relation.get_from_name
+
+    ALL = (EXTERNAL, PRIMARY, FULL)
+
+
+def check_format(format):
+    if format not in FORMAT.ALL:
+        raise exceptions.WrongSerializationFormatError(format)
+
+
+def get_encoded_values(relation, format):
+    '''
+    returns tuple of serialized records, value of record is placed at record.ordinal position
+    '''
+    check_format(format)
+
+    if format == FORMAT.EXTERNAL:
+        external_columns = [column for column in relation._columns if column.external]
+
+        if not external_columns:
+            raise exceptions.UnsupportedSerializationFormatError(relation.__name__, format)
+
+        return relation.column(external_columns[0].name)
+
+    if any(not record._primaries for record in relation.records):
+        raise exceptions.UnsupportedSerializationFormatError(relation.__name__, format)
+
+    if format == FORMAT.PRIMARY:
+        return tuple(record._primaries[0] for record in relation.records)
+
+    return tuple('%s.%s' % (relation.__name__, record._primaries[0]) for record in relation.records)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding_table(relation, format):
+    '''
+    record -> serialized value, records are hashed by identity
+    '''
+    return dict(zip(relation.records, get_encoded_values(relation, format)))
+
+
+@functools.lru_cache(maxsize=None)
+def get_decoding_table(relations, format):
+    '''
+    serialized value -> record for all records of relations, serialized values must be unique
+    '''
+    table = {}
+
+    for relation in relations:
+        for record, value in zip(relation.records, get_encoded_values(relation, format)):
+            if value in table:
+                raise exceptions.DuplicateSerializedValueError(value)
+
+            table[value] = record
+
+    return table
+
+
+class RecordEncoder(object):
+    '''
+    callable for "default" argument of json.dump(s), orjson.dumps and msgpack.packb
+
+    records are serialized in specified format, record sets — into lists of serialized records;
+    serialized values are taken from precomputed tables, table of relation is added on first use
+    '''
+    __slots__ = ('format', '_table')
+
+    def __init__(self, format=FORMAT.FULL):
+        check_format(format)
+
+        self.format = format
+        self._table = {}
+
+    def __call__(self, obj):
+        try:
+            return self._table[obj]
+        except (KeyError, TypeError):
+            # not processed yet or unhashable object
+            pass
+
+        if isinstance(obj, Record) and obj._relation is not None:
+            self._table.update(get_encoding_table(obj._relation, self.format))
+            return self._table[obj]
+
+        if isinstance(obj, RecordSet):
+            return [self(record) for record in obj]
+
+        raise TypeError('Object of type %s is not serializable' % type(obj).__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(format=FORMAT.FULL):
+    return RecordEncoder(format)
+
+
+class RecordJSONEncoder(json.JSONEncoder):
+    '''
+    encoder class for json.dumps(cls=...) and similar arguments (for example, of Django JsonResponse),
+    override record_format in subclass to change format
+    '''
+    record_format = FORMAT.FULL
+
+    def default(self, o):
+        if isinstance(o, (Record, RecordSet)):
+            return get_encoder(self.record_format)(o)
+
+        return super(RecordJSONEncoder, self).default(o)
+
+
+class RecordDecoder(object):
+    '''
+    converts serialized values back into records of specified relations
+    '''
+    __slots__ = ('format', '_table')
+
+    def __init__(self, *relations, format=FORMAT.FULL):
+        check_format(format)
+
+        self.format = format
+        self._table = get_decoding_table(relations, format)
+
+    def __call__(self, value):
+        try:
+            return self._table[value]
+        except (KeyError, TypeError):
+            raise exceptions.UnknownSerializedValueError(value)
+
+    def decode_many(self, values, missing=MISSING.RAISE, default=None):
+        '''
+        returns tuple of records for iterable of serialized values, missing values are processed as in Relation.from_values
+        '''
+        return map_records(self._table, values, missing, default, exceptions.UnknownSerializedValuesError)
@@ -1,11 +1,30 @@
 # coding: utf-8
 import copy
+import time
+import array
+import io
+import os
+import json
+import pickle
+import random
+import tempfile
+import collections
 
 from unittest import TestCase
 
-from rels.relations import Relation, Column, Record
+from rels.relations import Relation, Column, Index, Record, MISSING
+from rels.record_set import RecordSet, Subset
+from rels.serialization import FORMAT, RecordEncoder, RecordJSONEncoder, RecordDecoder
+from rels.mapping import Mapping
 
+import rels
 from rels import exceptions
+from rels import build_cache
+from rels import deferred_checks
+from rels import checker
+from rels import instrumentation
+from rels import loaders
+from rels import mapped
 
 class Enum(Relation):
     name = Column(primary=True, no_index=False, primary_checks=True)
@@ -173,6 +192,36 @@ class SimpleColumnTests(TestCase):
         self.assertEqual(column_1.get_index(records), {'str_1': (records[0], ),
                                                        'str_2': (records[1], )})
 
+    def test_get_index_unique_duplicates(self):
+        column_1 = Column()
+        column_1.initialize('column_1')
+
+        records = ( Record([column_1], ['str_1']),
+                    Record([column_1], ['str_2']),
+                    Record([column_1], ['str_2']))
+
+        self.assertRaises(exceptions.DuplicateValueError, column_1.get_index, records)
+
+    def test_get_index_not_unique_declaration_order(self):
+        column_1 = Column(unique=False)
+        column_1.initialize('column_1')
+
+        records = [Record([column_1], [i % 3]) for i in range(9)]
+
+        self.assertEqual(column_1.get_index(records), {0: (records[0], records[3], records[6]),
+                                                       1: (records[1], records[4], records[7]),
+                                                       2: (records[2], records[5], records[8])})
+
+    def test_check_uniqueness_restriction_with_values(self):
+        column_1 = Column()
+        column_1.initialize('column_1')
+
+        records = ( Record([column_1], ['uuid_1']),
+                    Record([column_1], ['uuid_2']))
+
+        self.assertRaises(exceptions.DuplicateValueError,
+                          column_1.check_uniqueness_restriction, records, values=('uuid_1', 'uuid_1'))
+
     # def test_repr(self):
     #     column = Column(related_name='rel_name')
     #     column.initialize(name='col_name')
@@ -207,6 +256,41 @@ class SimpleRecordTests(TestCase):
         self.assertEqual(repr(RelationDestinationRelation.records[0]),
                          'RelationDestinationRelation.STATE_1')
 
+    def test_record_class_slots(self):
+        record = SimplestRelation.records[0]
+        self.assertIs(type(record), SimplestRelation._record_class)
+        self.assertTrue(isinstance(record, Record))
+        self.assertEqual(type(record).__slots__, ('name', 'value'))
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_record_class_not_identifier_columns(self):
+        relation = type(Relation)('NamesRelation', (Relation,), {'name': Column(primary=True),
+                                                                  'from': Column(),
+                                                                  'unit-name': Column(),
+                                                                  'records': (('a', 1, 'x'),
+                                                                              ('b', 2, 'y'))})
+
+        self.assertEqual(getattr(relation.a, 'from'), 1)
+        self.assertEqual(getattr(relation.b, 'unit-name'), 'y')
+        self.assertEqual(relation.column('unit-name'), ('x', 'y'))
+
+        relation = loaders.from_rows('LoadedNamesRelation', [('a', 1)], attributes={'name': Column(primary=True),
+                                                                                     'in': Column()})
+        self.assertEqual(getattr(relation.a, 'in'), 1)
+
+    def test_record_class_per_relation(self):
+        self.assertIsNot(SimplestRelation._record_class, SimplestEnum._record_class)
+        self.assertIs(SimplestRelation._record_class._relation, SimplestRelation)
+
+    def test_generic_record_class_reused(self):
+        columns = (Column(name='col_1'), Column(name='col_2'))
+        self.assertIs(type(Record(columns, (1, 2))), type(Record(columns, (3, 4))))
+
+
+# relation must be importable to be pickled by reference
+class PickleRelation(Enum):
+    records = tuple(('NAME_%d' % i, i) for i in range(1000))
+
 
 class SimpleRelationTests(TestCase):
 
@@ -268,9 +352,51 @@ class SimpleRelationTests(TestCase):
         self.assertFalse(hasattr(SimplestEnum.state_2, '_is_val_1'))
         self.assertFalse(hasattr(SimplestEnum.state_2, '_is_val_2'))
 
+    def test_records_checks_are_class_attributes(self):
+        self.assertIn('is_state_1', SimplestEnum._record_class.__dict__)
+        self.assertIn('is_state_2', SimplestEnum._record_class.__dict__)
+        self.assertFalse(hasattr(Record, 'is_state_1'))
+
+    def test_records_checks_without_primary_checks(self):
+        class Relation_1(Relation):
+            name = Column(primary=True)
+            is_b = Column(primary=True)
+
+            records = (('a', 'c'),
+                       ('b', 'd'))
+
+        self.assertTrue(Relation_1.a.is_a)
+        self.assertFalse(Relation_1.b.is_a)
+        self.assertIs(Relation_1.b.is_c, False)
+        self.assertEqual(Relation_1.a.is_b, 'c') # column takes precedence
+
+    def test_records_checks_with_inheritance(self):
+        class BaseRelation(Relation):
+            name = Column(primary=True, primary_checks=True)
+            records = (('id_0',),)
+
+        class ChildRelation(BaseRelation):
+            records = (('id_1',),)
+
+        self.assertTrue(ChildRelation.id_0.is_id_0)
+        self.assertTrue(ChildRelation.id_1.is_id_1)
+        self.assertFalse(ChildRelation.id_1.is_id_0)
+
     def test_get_record_by_not_external_id(self):
         self.assertRaises(exceptions.NotExternalValueError, SimplestEnum, 'bla-bla')
 
+    def test_get_record_by_not_external_id_no_chained_error(self):
+        with self.assertRaises(exceptions.NotExternalValueError) as context:
+            SimplestEnum('bla-bla')
+
+        self.assertTrue(context.exception.__suppress_context__)
+        self.assertIsNone(context.exception.__cause__)
+
+    def test_get_record_by_equal_external_id(self):
+        self.assertIs(ShortcutEnum(1.0), ShortcutEnum.ID_1)
+        self.assertRaises(exceptions.NotExternalValueError, ShortcutEnum, 3)
+        self.assertRaises(exceptions.NotExternalValueError, ShortcutEnum, 'ID_1')
+
     def test_more_then_1_external_columns(self):
         def create_bad_relation():
             class SimplestRelation(Relation):
@@ -349,6 +475,129 @@ class SimpleRelationTests(TestCase):
                           'val_3_3': IndexesRelation.rec_3,
                           'val_3_4': IndexesRelation.rec_4 })
 
+    def test_lazy_indexes(self):
+        class LazyRelation(Relation, lazy_indexes=True):
+            name = Column(primary=True)
+            value = Column(external=True)
+            group = Column(unique=False, no_index=False)
+
+            records = (('name_1', 1, 'a'),
+                       ('name_2', 2, 'b'),
+                       ('name_3', 3, 'a'))
+
+        self.assertFalse(isinstance(LazyRelation.__dict__['index_group'], dict))
+        self.assertFalse(isinstance(LazyRelation.__dict__['_external_index'], dict))
+
+        self.assertEqual(LazyRelation.index_group, {'a': (LazyRelation.name_1, LazyRelation.name_3),
+                                                    'b': (LazyRelation.name_2,)})
+        self.assertIs(LazyRelation.__dict__['index_group'], LazyRelation.index_group)
+
+        self.assertIs(LazyRelation(2), LazyRelation.name_2)
+        self.assertIs(LazyRelation.__dict__['_external_index'], LazyRelation.index_value)
+        self.assertRaises(exceptions.NotExternalValueError, LazyRelation, 4)
+
+    def test_lazy_indexes_inheritance(self):
+        class LazyRelation(Relation, lazy_indexes=True):
+            name = Column(primary=True)
+            value = Column(external=True)
+
+        class ChildRelation(LazyRelation):
+            records = (('name_1', 1),)
+
+        class EagerRelation(LazyRelation, lazy_indexes=False):
+            records = (('name_1', 1),)
+
+        self.assertFalse(isinstance(ChildRelation.__dict__['index_value'], dict))
+        self.assertIs(ChildRelation(1), ChildRelation.name_1)
+
+        self.assertTrue(isinstance(EagerRelation.__dict__['index_value'], dict))
+
+    def test_lazy_indexes_uniqueness_restriction(self):
+        def create_bad_relation():
+            class LazyRelation(Relation, lazy_indexes=True):
+                name = Column()
+                value = Column(external=True)
+
+                records = (('name_a', 1),
+                           ('name_b', 1))
+
+        self.assertRaises(exceptions.DuplicateValueError, create_bad_relation)
+
+    def test_composite_indexes(self):
+        class CompositeRelation(Relation):
+            name = Column(primary=True)
+            category = Column(unique=False)
+            level = Column(unique=False)
+
+            index_category_level = Index('category', 'level')
+            by_category = Index('category', unique=False)
+
+            records = (('name_1', 'a', 1),
+                       ('name_2', 'a', 2),
+                       ('name_3', 'b', 1))
+
+        self.assertEqual(CompositeRelation.index_category_level,
+                         {('a', 1): CompositeRelation.name_1,
+                          ('a', 2): CompositeRelation.name_2,
+                          ('b', 1): CompositeRelation.name_3})
+
+        self.assertEqual(CompositeRelation.by_category,
+                         {('a',): (CompositeRelation.name_1, CompositeRelation.name_2),
+                          ('b',): (CompositeRelation.name_3,)})
+
+    def test_composite_indexes_lazy_and_inheritance(self):
+        class BaseRelation(Relation, lazy_indexes=True):
+            name = Column(primary=True)
+            category = Column(unique=False)
+            level = Column(unique=False)
+
+            index_category_level = Index('category', 'level')
+
+        class ChildRelation(BaseRelation):
+            records = (('name_1', 'a', 1),
+                       ('name_2', 'b', 1))
+
+        self.assertFalse(isinstance(ChildRelation.__dict__['index_category_level'], dict))
+        self.assertEqual(ChildRelation.index_category_level,
+                         {('a', 1): ChildRelation.name_1,
+                          ('b', 1): ChildRelation.name_2})
+        self.assertEqual(BaseRelation.index_category_level, {})
+
+    def test_composite_indexes_uniqueness_restriction(self):
+        for lazy_indexes in (False, True):
+            def create_bad_relation():
+                class CompositeRelation(Relation, lazy_indexes=lazy_indexes):
+                    name = Column(primary=True)
+                    category = Column(unique=False)
+                    level = Column(unique=False)
+
+                    index_category_level = Index('category', 'level')
+
+                    records = (('name_1', 'a', 1),
+                               ('name_2', 'b', 1),
+                               ('name_3', 'a', 1))
+
+            self.assertRaises(exceptions.DuplicateIndexValueError, create_bad_relation)
+
+    def test_composite_indexes_wrong_column(self):
+        def create_bad_relation():
+            class CompositeRelation(Relation):
+                name = Column(primary=True)
+                index_name_level = Index('name', 'level')
+
+        self.assertRaises(exceptions.WrongIndexColumnError, create_bad_relation)
+
+    def test_composite_index_duplicate_another_relation_attribute(self):
+        def create_bad_relation():
+            class CompositeRelation(Relation):
+                name = Column(primary=True)
+                level = Column(unique=False)
+                name_1 = Index('name', 'level')
+
+                records = (('name_1', 1),)
+
+        self.assertRaises(exceptions.IndexDuplicatesRelationAttributeError, create_bad_relation)
+
     def test_index_duplicate_another_relation_attribute(self):
         def create_bad_relation():
             class SimplestRelation(Relation):
@@ -475,3 +724,1154 @@ class SimpleRelationTests(TestCase):
 
     def test_deepcopy_record(self):
         self.assertEqual(id(SimplestRelation.records[0]), id(copy.deepcopy(SimplestRelation.records[0])))
+
+    def test_pickle_relation(self):
+        self.assertIs(pickle.loads(pickle.dumps(SimplestEnum)), SimplestEnum)
+
+    def test_pickle_record_by_primary(self):
+        self.assertIs(pickle.loads(pickle.dumps(SimplestEnum.state_2)), SimplestEnum.state_2)
+        self.assertTrue(pickle.loads(pickle.dumps(SimplestEnum.state_2)).is_state_2)
+
+    def test_pickle_record_by_ordinal(self):
+        self.assertIs(pickle.loads(pickle.dumps(SimplestRelation.records[1])), SimplestRelation.records[1])
+
+    def test_pickle_records_batch(self):
+        data = pickle.dumps(PickleRelation.records)
+        self.assertTrue(all(a is b for a, b in zip(pickle.loads(data), PickleRelation.records)))
+        self.assertLess(len(data), 20 * len(PickleRelation.records))
+
+    def test_pickle_record_without_relation(self):
+        record = Record([Column(name='col_1')], [1])
+        self.assertRaises(pickle.PicklingError, pickle.dumps, record)
+
+
+class ScalingTests(TestCase):
+
+    # scaling target: relation with 1M records, external column and not unique index builds in seconds
+    RECORDS_NUMBER = 1000000
+    MAX_BUILD_TIME = 10
+
+    def test_large_relation_build_time(self):
+        raw_records = [(i, i % 10, 'text %d' % i) for i in range(self.RECORDS_NUMBER)]
+
+        started_at = time.time()
+
+        class LargeRelation(Relation):
+            value = Column(external=True)
+            group = Column(unique=False, no_index=False)
+            text = Column()
+
+            records = raw_records
+
+        self.assertLess(time.time() - started_at, self.MAX_BUILD_TIME)
+
+        self.assertEqual(len(LargeRelation.records), self.RECORDS_NUMBER)
+        self.assertEqual(len(LargeRelation.index_group[3]), self.RECORDS_NUMBER // 10)
+        self.assertEqual(LargeRelation(777).text, 'text 777')
+
+
+class QueryRelation(Relation):
+    name = Column(primary=True)
+    value = Column(external=True)
+    kind = Column(unique=False, no_index=False)
+    level = Column(unique=False)
+
+    records = (('name_1', 1, 'a', 1),
+               ('name_2', 2, 'b', 2),
+               ('name_3', 3, 'a', 3),
+               ('name_4', 4, 'b', 4),
+               ('name_5', 5, 'a', 5))
+
+
+class QueryTests(TestCase):
+
+    def test_select(self):
+        self.assertEqual(SimplestRelation.select('value', 'name'), ((1, 'name_a'), (2, 'name_b')))
+        self.assertEqual(SimplestRelation.select('value'), ((1,), (2,)))
+        self.assertEqual(SimplestRelation.select(), ((), ()))
+
+    def test_iter_select(self):
+        rows = SimplestRelation.iter_select('name')
+        self.assertFalse(isinstance(rows, tuple))
+        self.assertEqual(next(rows), ('name_a',))
+        self.assertEqual(list(rows), [('name_b',)])
+
+    def test_select_related_name(self):
+        self.assertEqual(RelationDestinationRelation.select('name', 'rel_source'),
+                         (('STATE_1', RelationSourceRelation.STATE_1),
+                          ('STATE_2', RelationSourceRelation.STATE_2)))
+
+    def test_ordinal(self):
+        for i, record in enumerate(QueryRelation.records):
+            self.assertEqual(record.ordinal, i)
+
+    def test_column(self):
+        self.assertEqual(QueryRelation.column('kind'), ('a', 'b', 'a', 'b', 'a'))
+        self.assertEqual(QueryRelation.column('value')[QueryRelation.name_3.ordinal], 3)
+        self.assertEqual(EmptyRecordsRelation.column('name'), ())
+        self.assertRaises(exceptions.UnknownColumnError, QueryRelation.column, 'unknown')
+
+    def test_projection(self):
+        projection = QueryRelation.projection('value', 'kind')
+        self.assertEqual(projection, {1: 'a', 2: 'b', 3: 'a', 4: 'b', 5: 'a'})
+        self.assertIs(QueryRelation.projection('value', 'kind'), projection)
+
+    def test_projection_not_unique_source(self):
+        self.assertRaises(exceptions.DuplicateValueError, QueryRelation.projection, 'kind', 'value')
+
+    def test_filter_exact(self):
+        self.assertEqual(QueryRelation.filter(kind='a'),
+                         (QueryRelation.name_1, QueryRelation.name_3, QueryRelation.name_5))
+        self.assertEqual(QueryRelation.filter(value__exact=2), (QueryRelation.name_2,))
+        self.assertEqual(QueryRelation.filter(level=2), (QueryRelation.name_2,))
+        self.assertEqual(QueryRelation.filter(level=7), ())
+        self.assertEqual(QueryRelation.filter(value=7), ())
+
+    def test_filter_lookups(self):
+        self.assertEqual(QueryRelation.filter(level__gte=4), (QueryRelation.name_4, QueryRelation.name_5))
+        self.assertEqual(QueryRelation.filter(level__gt=4), (QueryRelation.name_5,))
+        self.assertEqual(QueryRelation.filter(level__lte=1), (QueryRelation.name_1,))
+        self.assertEqual(QueryRelation.filter(level__lt=2), (QueryRelation.name_1,))
+        self.assertEqual(QueryRelation.filter(kind__ne='a'), (QueryRelation.name_2, QueryRelation.name_4))
+
+    def test_filter_in(self):
+        self.assertEqual(QueryRelation.filter(value__in=[5, 1, 7]), (QueryRelation.name_1, QueryRelation.name_5))
+        self.assertEqual(QueryRelation.filter(level__in=(4, 2)), (QueryRelation.name_2, QueryRelation.name_4))
+        self.assertEqual(QueryRelation.filter(value__in=(value for value in (3, 2))),
+                         (QueryRelation.name_2, QueryRelation.name_3))
+
+    def test_filter_combined(self):
+        self.assertEqual(QueryRelation.filter(kind='a', level__gte=2), (QueryRelation.name_3, QueryRelation.name_5))
+        self.assertEqual(QueryRelation.filter(lambda record: record.value % 2 == 0, kind='b', level__lt=4),
+                         (QueryRelation.name_2,))
+
+    def test_filter_unhashable_value(self):
+        self.assertEqual(QueryRelation.filter(kind=['a']), ())
+
+    def test_filter_wrong_condition(self):
+        self.assertRaises(exceptions.WrongFilterConditionError, QueryRelation.filter, unknown=1)
+        self.assertRaises(exceptions.WrongFilterConditionError, QueryRelation.filter, level__unknown=1)
+        self.assertRaises(exceptions.WrongFilterConditionError, QueryRelation.where, unknown=1)
+
+    def test_filter_memoization(self):
+        result = QueryRelation.filter(kind='b', level__in=[2, 4])
+        self.assertIs(QueryRelation.filter(level__in=[2, 4], kind='b'), result)
+        self.assertIsNot(QueryRelation.filter(lambda record: True, kind='b'), QueryRelation.filter(lambda record: True, kind='b'))
+
+    def test_filter_memoization_value_types(self):
+        class PayloadRelation(Relation):
+            name = Column(primary=True)
+            payload = Column(unique=False, single_type=False)
+
+            records = (('A', [1, 2]),
+                       ('B', (1, 2)))
+
+        self.assertEqual(PayloadRelation.filter(payload=(1, 2)), (PayloadRelation.B,))
+        self.assertEqual(PayloadRelation.filter(payload=[1, 2]), (PayloadRelation.A,))
+        self.assertEqual(PayloadRelation.filter(payload__in=[(1, 2)]), (PayloadRelation.B,))
+        self.assertEqual(PayloadRelation.filter(payload__in=((1, 2),)), (PayloadRelation.B,))
+
+    def test_filter_memoization_iterators(self):
+        cache = QueryRelation._queries_cache
+        cache.clear()
+
+        for _ in range(3):
+            self.assertEqual(QueryRelation.filter(value__in=iter([3, 2])), (QueryRelation.name_2, QueryRelation.name_3))
+
+        self.assertEqual(list(cache), [(('value__in', (3, 2)),)])
+
+    def test_where(self):
+        records = QueryRelation.where(kind='a')
+        self.assertFalse(isinstance(records, tuple))
+        self.assertEqual(next(records), QueryRelation.name_1)
+        self.assertEqual(list(records), [QueryRelation.name_3, QueryRelation.name_5])
+
+
+class FromValuesTests(TestCase):
+
+    def test_from_values(self):
+        self.assertEqual(ShortcutEnum.from_values([2, 1, 2]), (ShortcutEnum.ID_2, ShortcutEnum.ID_1, ShortcutEnum.ID_2))
+        self.assertEqual(ShortcutEnum.from_values([]), ())
+
+    def test_from_values_array_and_buffer(self):
+        values = array.array('q', [1, 2, 1])
+        self.assertEqual(ShortcutEnum.from_values(values), (ShortcutEnum.ID_1, ShortcutEnum.ID_2, ShortcutEnum.ID_1))
+        self.assertEqual(ShortcutEnum.from_values(memoryview(values)), (ShortcutEnum.ID_1, ShortcutEnum.ID_2, ShortcutEnum.ID_1))
+
+    def test_from_values_iterator(self):
+        self.assertEqual(ShortcutEnum.from_values(value for value in (1, 2)), (ShortcutEnum.ID_1, ShortcutEnum.ID_2))
+
+    def test_from_values_raise(self):
+        with self.assertRaises(exceptions.NotExternalValuesError) as context:
+            ShortcutEnum.from_values(value for value in (1, 3, 2, 4))
+
+        self.assertEqual(context.exception.positions, [1, 3])
+        self.assertEqual(context.exception.values, [3, 4])
+
+    def test_from_values_default(self):
+        self.assertEqual(ShortcutEnum.from_values([1, 3], missing=MISSING.DEFAULT), (ShortcutEnum.ID_1, None))
+        self.assertEqual(ShortcutEnum.from_values([1, 3], missing=MISSING.DEFAULT, default=ShortcutEnum.ID_2),
+                         (ShortcutEnum.ID_1, ShortcutEnum.ID_2))
+
+    def test_from_values_skip(self):
+        self.assertEqual(ShortcutEnum.from_values([3, 1, 4, 2], missing=MISSING.SKIP), (ShortcutEnum.ID_1, ShortcutEnum.ID_2))
+
+    def test_from_values_wrong_missing_mode(self):
+        self.assertRaises(exceptions.WrongMissingModeError, ShortcutEnum.from_values, [1], missing='unknown')
+
+
+class RecordSetTests(TestCase):
+
+    def test_records(self):
+        record_set = RecordSet(QueryRelation, [QueryRelation.name_3, QueryRelation.name_1, QueryRelation.name_3])
+
+        self.assertEqual(list(record_set), [QueryRelation.name_1, QueryRelation.name_3])
+        self.assertEqual(len(record_set), 2)
+        self.assertEqual(record_set.mask, 0b101)
+        self.assertTrue(record_set)
+        self.assertFalse(RecordSet(QueryRelation))
+
+    def test_contains(self):
+        record_set = RecordSet(QueryRelation, [QueryRelation.name_2])
+
+        self.assertIn(QueryRelation.name_2, record_set)
+        self.assertNotIn(QueryRelation.name_1, record_set)
+        self.assertNotIn(ShortcutEnum.ID_2, record_set)
+        self.assertNotIn(None, record_set)
+
+    def test_wrong_record(self):
+        self.assertRaises(exceptions.WrongRecordSetRecordError, RecordSet, QueryRelation, [ShortcutEnum.ID_1])
+
+    def test_from_mask(self):
+        self.assertEqual(RecordSet.from_mask(QueryRelation, 0b110), RecordSet(QueryRelation, [QueryRelation.name_2, QueryRelation.name_3]))
+        self.assertNotEqual(RecordSet.from_mask(QueryRelation, 0b110), RecordSet(QueryRelation, [QueryRelation.name_2]))
+
+    def test_from_mask_wrong_mask(self):
+        self.assertRaises(exceptions.WrongRecordSetMaskError, RecordSet.from_mask, QueryRelation, -1)
+        self.assertRaises(exceptions.WrongRecordSetMaskError, RecordSet.from_mask, QueryRelation, 1 << len(QueryRelation.records))
+
+    def test_hash(self):
+        self.assertEqual(len({RecordSet(QueryRelation, [QueryRelation.name_1]), RecordSet.from_mask(QueryRelation, 1)}), 1)
+
+    def test_algebra(self):
+        first = RecordSet.from_mask(QueryRelation, 0b00111)
+        second = RecordSet.from_mask(QueryRelation, 0b01100)
+
+        self.assertEqual((first | second).mask, 0b01111)
+        self.assertEqual((first & second).mask, 0b00100)
+        self.assertEqual((first - second).mask, 0b00011)
+        self.assertEqual((first ^ second).mask, 0b01011)
+        self.assertEqual((~first).mask, 0b11000)
+
+        self.assertEqual(list(first & second), [QueryRelation.name_3])
+        self.assertIn(QueryRelation.name_4, first | second)
+        self.assertIsInstance(first - second, RecordSet)
+
+    def test_algebra_with_iterables(self):
+        record_set = RecordSet(QueryRelation, [QueryRelation.name_1])
+
+        self.assertEqual(record_set.union([QueryRelation.name_2], (QueryRelation.name_3,)).mask, 0b111)
+        self.assertEqual(record_set.intersection([QueryRelation.name_2]).mask, 0)
+        self.assertTrue(record_set.issubset([QueryRelation.name_1, QueryRelation.name_2]))
+        self.assertTrue(record_set.isdisjoint([QueryRelation.name_2]))
+        self.assertRaises(exceptions.WrongRecordSetRecordError, record_set.union, [ShortcutEnum.ID_1])
+
+    def test_comparison(self):
+        small = RecordSet(QueryRelation, [QueryRelation.name_1])
+        big = RecordSet(QueryRelation, [QueryRelation.name_1, QueryRelation.name_2])
+
+        self.assertTrue(small < big)
+        self.assertTrue(small <= small)
+        self.assertTrue(big > small)
+        self.assertFalse(big < big)
+        self.assertNotEqual(small, frozenset(small))
+
+    def test_wrong_relation(self):
+        self.assertRaises(exceptions.WrongRecordSetRelationError,
+                          lambda: RecordSet(QueryRelation) | RecordSet(ShortcutEnum))
+        self.assertNotEqual(RecordSet(QueryRelation), RecordSet(ShortcutEnum))
+
+    def test_pickle(self):
+        record_set = RecordSet(QueryRelation, [QueryRelation.name_2, QueryRelation.name_5])
+        self.assertEqual(pickle.loads(pickle.dumps(record_set)), record_set)
+
+    def test_subsets(self):
+        class SubsetRelation(Relation):
+            name = Column(primary=True)
+            level = Column(unique=False)
+
+            records = (('low', 1),
+                       ('middle', 2),
+                       ('high', 3))
+
+            EDGES = Subset('high', 'low')
+            UPPER = Subset(level__gte=2)
+            ODD = Subset(lambda record: record.level % 2)
+
+        self.assertEqual(list(SubsetRelation.EDGES), [SubsetRelation.low, SubsetRelation.high])
+        self.assertEqual(list(SubsetRelation.UPPER), [SubsetRelation.middle, SubsetRelation.high])
+        self.assertEqual(SubsetRelation.ODD, SubsetRelation.EDGES)
+        self.assertIn(SubsetRelation.high, SubsetRelation.UPPER & SubsetRelation.EDGES)
+
+        class ChildRelation(SubsetRelation):
+            records = (('top', 4),)
+
+        self.assertEqual(list(ChildRelation.UPPER), [ChildRelation.middle, ChildRelation.high, ChildRelation.top])
+        self.assertIs(ChildRelation.EDGES.relation, ChildRelation)
+
+    def test_subsets_errors(self):
+        with self.assertRaises(exceptions.UnknownSubsetRecordError):
+            class UnknownRecordRelation(Relation):
+                name = Column(primary=True)
+                records = (('first',),)
+                WRONG = Subset('second')
+
+        with self.assertRaises(exceptions.WrongSubsetDefinitionError):
+            class WrongDefinitionRelation(Relation):
+                name = Column(primary=True)
+                records = (('first',),)
+                WRONG = Subset('first', name='first')
+
+        with self.assertRaises(exceptions.PrimaryDuplicatesRelationAttributeError):
+            class DuplicateRelation(Relation):
+                name = Column(primary=True)
+                records = (('first',),)
+                first = Subset('first')
+
+
+class SerializationTests(TestCase):
+
+    def setUp(self):
+        self.data = {'record': QueryRelation.name_2,
+                     'records': [QueryRelation.name_1, RecordSet(QueryRelation, [QueryRelation.name_3, QueryRelation.name_4])]}
+
+    def test_encode_full(self):
+        self.assertEqual(json.loads(json.dumps(self.data, default=RecordEncoder())),
+                         {'record': 'QueryRelation.name_2',
+                          'records': ['QueryRelation.name_1', ['QueryRelation.name_3', 'QueryRelation.name_4']]})
+
+    def test_encode_external(self):
+        self.assertEqual(json.dumps(self.data, default=RecordEncoder(FORMAT.EXTERNAL)), '{"record": 2, "records": [1, [3, 4]]}')
+
+    def test_encode_primary(self):
+        self.assertEqual(json.loads(json.dumps(self.data, default=RecordEncoder(FORMAT.PRIMARY))),
+                         {'record': 'name_2', 'records': ['name_1', ['name_3', 'name_4']]})
+
+    def test_encode_several_relations(self):
+        self.assertEqual(json.dumps([QueryRelation.name_1, ShortcutEnum.ID_2], default=RecordEncoder()),
+                         '["QueryRelation.name_1", "ShortcutEnum.ID_2"]')
+
+    def test_encode_unsupported_object(self):
+        self.assertRaises(TypeError, json.dumps, [object()], default=RecordEncoder())
+        self.assertRaises(TypeError, json.dumps, [object()], cls=RecordJSONEncoder)
+
+    def test_encode_unsupported_format(self):
+        self.assertRaises(exceptions.WrongSerializationFormatError, RecordEncoder, 'unknown')
+        self.assertRaises(exceptions.UnsupportedSerializationFormatError, json.dumps, SimplestRelation.records, default=RecordEncoder(FORMAT.EXTERNAL))
+        self.assertRaises(exceptions.UnsupportedSerializationFormatError, json.dumps, SimplestRelation.records, default=RecordEncoder(FORMAT.FULL))
+
+    def test_json_encoder_class(self):
+        class ExternalEncoder(RecordJSONEncoder):
+            record_format = FORMAT.EXTERNAL
+
+        self.assertEqual(json.dumps(QueryRelation.name_1, cls=RecordJSONEncoder), '"QueryRelation.name_1"')
+        self.assertEqual(json.dumps(QueryRelation.name_1, cls=ExternalEncoder), '1')
+
+    def test_decode(self):
+        self.assertEqual(RecordDecoder(QueryRelation)('QueryRelation.name_2'), QueryRelation.name_2)
+        self.assertEqual(RecordDecoder(QueryRelation, format=FORMAT.EXTERNAL)(2), QueryRelation.name_2)
+        self.assertEqual(RecordDecoder(QueryRelation, format=FORMAT.PRIMARY)('name_2'), QueryRelation.name_2)
+        self.assertRaises(exceptions.UnknownSerializedValueError, RecordDecoder(QueryRelation), 'QueryRelation.unknown')
+        self.assertRaises(exceptions.UnknownSerializedValueError, RecordDecoder(QueryRelation), [])
+
+    def test_decode_many(self):
+        decoder = RecordDecoder(QueryRelation, ShortcutEnum)
+
+        self.assertEqual(decoder.decode_many(['ShortcutEnum.ID_1', 'QueryRelation.name_3']), (ShortcutEnum.ID_1, QueryRelation.name_3))
+        self.assertEqual(decoder.decode_many(['QueryRelation.name_3', 'unknown'], missing=MISSING.SKIP), (QueryRelation.name_3,))
+
+        with self.assertRaises(exceptions.UnknownSerializedValuesError) as context:
+            decoder.decode_many(['unknown', 'QueryRelation.name_3'])
+
+        self.assertEqual(context.exception.positions, [0])
+
+    def test_decode_duplicate_values(self):
+        self.assertRaises(exceptions.DuplicateSerializedValueError, RecordDecoder, QueryRelation, ShortcutEnum, format=FORMAT.EXTERNAL)
+
+    def test_round_trip(self):
+        encoded = json.dumps([record for record in QueryRelation.records], default=RecordEncoder(FORMAT.EXTERNAL))
+        self.assertEqual(RecordDecoder(QueryRelation, format=FORMAT.EXTERNAL).decode_many(json.loads(encoded)), QueryRelation.records)
+
+
+class BuildCacheTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        build_cache.enable(self.directory.name)
+
+    def tearDown(self):
+        build_cache.disable()
+        self.directory.cleanup()
+
+    def create_relation(self, records):
+        return type(Relation)('CachedRelation', (Relation,), {'name': Column(primary=True, primary_checks=True),
+                                                              'value': Column(external=True),
+                                                              'kind': Column(unique=False, no_index=False),
+                                                              'records': records})
+
+    def test_snapshot_saved_and_used(self):
+        records = (('A', 1, 'x'), ('B', 2, 'x'))
+
+        self.create_relation(records)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+        relation = self.create_relation(records)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+        self.assertTrue(relation.A.is_A)
+        self.assertFalse(relation.B.is_A)
+        self.assertEqual(relation(2), relation.B)
+        self.assertEqual(relation.index_kind['x'], (relation.A, relation.B))
+
+    def test_snapshot_format(self):
+        self.create_relation((('A', 1, 'x'), ('B', 2, 'x')))
+
+        [filename] = os.listdir(self.directory.name)
+
+        with open(os.path.join(self.directory.name, filename)) as snapshot_file:
+            self.assertEqual(json.load(snapshot_file), {'primary_checks': {'name': ['A', 'B']}})
+
+    def test_wrong_snapshot_ignored(self):
+        records = (('A', 1, 'x'), ('B', 2, 'x'))
+
+        self.create_relation(records)
+
+        [filename] = os.listdir(self.directory.name)
+        path = os.path.join(self.directory.name, filename)
+
+        for content in (pickle.dumps({'primary_checks': {}}),
+                        b'{"primary_checks": {"name": "AB"}}',
+                        b'{"primary_checks": {"name": [1, 2]}}',
+                        b'["primary_checks"]'):
+            with open(path, 'wb') as snapshot_file:
+                snapshot_file.write(content)
+
+            self.assertIsNone(build_cache.load(filename[:-len('.json')]))
+
+            relation = self.create_relation(records)
+
+            self.assertTrue(relation.A.is_A)
+            self.assertTrue(relation.B.is_B)
+
+    def test_different_records(self):
+        self.create_relation((('A', 1, 'x'),))
+        self.create_relation((('A', 1, 'y'),))
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+
+    def test_wrong_relation_not_cached(self):
+        records = (('A', 1, 'x'), ('B', 1, 'x'))
+
+        self.assertRaises(exceptions.DuplicateValueError, self.create_relation, records)
+        self.assertRaises(exceptions.DuplicateValueError, self.create_relation, records)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_unpicklable_records(self):
+        relation = self.create_relation((('A', 1, lambda: None),))
+        self.assertTrue(relation.A.is_A)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+class DeferredChecksTests(TestCase):
+
+    def setUp(self):
+        deferred_checks.enable()
+
+    def tearDown(self):
+        deferred_checks.disable()
+
+    def create_wrong_relation(self):
+        class WrongRelation(Relation):
+            name = Column(primary=True, primary_checks=True)
+            value = Column(external=True)
+            kind = Column()
+            is_b = Column(unique=False)
+            by_kind = Index('kind', 'is_b')
+            filter_me = 1
+
+            records = (('a', 1, 'x', 1),
+                       ('b', 1, 2, 1),
+                       ('filter_me', 3, 'x', 1))
+
+        return WrongRelation
+
+    def test_checks_skipped(self):
+        relation = self.create_wrong_relation()
+        self.assertEqual(relation.a.value, 1)
+
+    def test_checks_not_skipped_by_default(self):
+        deferred_checks.disable()
+        self.assertRaises(exceptions.DuplicateValueError, self.create_wrong_relation)
+
+    def test_related_name_checked(self):
+        with self.assertRaises(exceptions.SetRelatedNameError):
+            class WrongRelatedNameRelation(Relation):
+                name = Column(primary=True)
+                related = Column(related_name='source')
+                records = (('a', 1),)
+
+    def test_check_relation(self):
+        errors = checker.check_relation(self.create_wrong_relation())
+
+        self.assertEqual([error.__class__ for error in errors],
+                         [exceptions.DuplicateValueError,        # value
+                          exceptions.SingleTypeError,            # kind
+                          exceptions.DuplicateValueError,        # kind
+                          exceptions.DuplicateIndexValueError,   # by_kind
+                          exceptions.PrimaryDuplicatesRelationAttributeError,
+                          exceptions.DuplicateIsPrimaryError])   # is_b
+
+    def test_check_correct_relation(self):
+        self.assertEqual(checker.check_relation(QueryRelation), [])
+        self.assertEqual(checker.check_relation(EnumWith2Primaries), [])
+
+    def test_check_packages(self):
+        output = io.StringIO()
+
+        self.assertEqual(checker.check_packages(['rels.shortcuts'], jobs=2, output=output), 0)
+        self.assertEqual(output.getvalue(), 'checked 2 relations, found 0 violations\n')
+        self.assertTrue(deferred_checks.is_enabled())
+
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        self.events = []
+        instrumentation.add_callback(self.callback)
+        instrumentation.enable()
+        instrumentation.reset()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.remove_callback(self.callback)
+
+    def callback(self, event, relation, value):
+        self.events.append((event, relation, value))
+
+    def create_relation(self, lazy_indexes=False):
+        class InstrumentedRelation(Relation, lazy_indexes=lazy_indexes):
+            name = Column(primary=True)
+            value = Column(external=True)
+            kind = Column(unique=False, no_index=False)
+
+            records = (('a', 1, 'x'),
+                       ('b', 2, 'x'))
+
+        return InstrumentedRelation
+
+    def get_stats(self, relation):
+        return instrumentation.relation_stats(relation)
+
+    def test_stats(self):
+        self.assertEqual(rels.stats()['rels.tests.QueryRelation'], self.get_stats(QueryRelation))
+
+    def test_build(self):
+        relation = self.create_relation()
+
+        stats = self.get_stats(relation)
+
+        self.assertGreater(stats['build_duration'], 0)
+        self.assertEqual(stats['records'], 2)
+        self.assertGreater(stats['records_memory'], 0)
+        self.assertGreater(stats['indexes_memory'], 0)
+        self.assertEqual(self.events, [('build', relation, stats['build_duration'])])
+
+    def test_build_before_enabling(self):
+        self.assertEqual(self.get_stats(QueryRelation)['build_duration'], None)
+
+    def test_counters(self):
+        relation = self.create_relation()
+
+        relation(1)
+        relation(2)
+        self.assertRaises(exceptions.NotExternalValueError, relation, 3)
+        relation.get_from_name('InstrumentedRelation.a')
+        relation.index_kind.get('x')
+        self.assertNotIn('y', relation.index_kind)
+
+        stats = self.get_stats(relation)
+
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(stats['calls_misses'], 1)
+        self.assertEqual(stats['get_from_name'], 1)
+        self.assertEqual(stats['index_accesses'], {'index_value': 3, 'index_kind': 2})
+        self.assertEqual(stats['index_misses'], {'index_value': 1, 'index_kind': 1})
+        self.assertEqual(self.events[-1], ('miss', relation, 3))
+
+    def test_lazy_indexes(self):
+        relation = self.create_relation(lazy_indexes=True)
+
+        self.assertEqual(self.get_stats(relation)['index_accesses'], {})
+
+        relation(1)
+        relation.index_kind['x']
+
+        self.assertEqual(self.get_stats(relation)['index_accesses'], {'index_value': 1, 'index_kind': 1})
+
+    def test_relations_instrumented_on_enable(self):
+        instrumentation.disable()
+
+        self.assertIs(type(QueryRelation.index_value), dict)
+
+        instrumentation.enable()
+
+        QueryRelation(1)
+        self.assertEqual(self.get_stats(QueryRelation)['calls'], 1)
+        self.assertEqual(self.get_stats(QueryRelation)['index_accesses']['index_value'], 1)
+
+    def test_disable(self):
+        relation = self.create_relation()
+
+        instrumentation.disable()
+
+        self.assertIs(type(relation.index_value), dict)
+        self.assertIs(relation._external_index, relation.index_value)
+
+        relation(1)
+        relation.get_from_name('InstrumentedRelation.a')
+
+        self.assertEqual(self.get_stats(relation)['calls'], 0)
+        self.assertEqual(self.get_stats(relation)['get_from_name'], 0)
+
+
+class LoadedUnitBase(Relation):
+    name = Column(primary=True)
+    value = Column(external=True)
+    weight = Column(unique=False)
+
+
+LOADED_UNIT = loaders.from_rows('LOADED_UNIT', (('unit_%d' % i, str(i), str(i / 2)) for i in range(3)),
+                                bases=(LoadedUnitBase,),
+                                converters={'value': int, 'weight': float})
+
+
+class LoadersTests(TestCase):
+
+    def test_from_rows(self):
+        self.assertEqual(LOADED_UNIT.records, (LOADED_UNIT.unit_0, LOADED_UNIT.unit_1, LOADED_UNIT.unit_2))
+        self.assertEqual(LOADED_UNIT(1), LOADED_UNIT.unit_1)
+        self.assertEqual(LOADED_UNIT.unit_1.weight, 0.5)
+        self.assertEqual(LOADED_UNIT.__module__, 'rels.tests')
+
+    def test_pickle(self):
+        self.assertIs(pickle.loads(pickle.dumps(LOADED_UNIT.unit_2)), LOADED_UNIT.unit_2)
+
+    def test_generator_records(self):
+        class GeneratorRelation(Relation):
+            name = Column(primary=True)
+            records = (('name_%d' % i,) for i in range(2))
+
+        self.assertEqual(GeneratorRelation.records, (GeneratorRelation.name_0, GeneratorRelation.name_1))
+
+    def test_from_rows_mappings(self):
+        relation = loaders.from_rows('MappingRelation',
+                                     [{'value': '1', 'name': 'a', 'weight': 1},
+                                      {'value': '2', 'name': 'b', 'weight': 2, 'extra': 3}],
+                                     bases=(LoadedUnitBase,),
+                                     converters={'value': int})
+        self.assertEqual(relation(2), relation.b)
+
+    def test_from_rows_attributes(self):
+        relation = loaders.from_rows('AttributesRelation', [('a', 1)], attributes={'name': Column(primary=True),
+                                                                                  'value': Column(external=True)})
+        self.assertEqual(relation(1), relation.a)
+
+    def test_from_rows_errors(self):
+        self.assertRaises(exceptions.UnknownColumnError, loaders.from_rows, 'Wrong', [], bases=(LoadedUnitBase,), converters={'unknown': int})
+        self.assertRaises(exceptions.RecordsInLoadedRelationError, loaders.from_rows, 'Wrong', [], bases=(LoadedUnitBase,), attributes={'records': ()})
+        self.assertRaises(exceptions.ColumnsNumberError, loaders.from_rows, 'Wrong', [('a', '1')], bases=(LoadedUnitBase,), converters={'value': int})
+        self.assertRaises(exceptions.MissedRowValueError, loaders.from_rows, 'Wrong', [{'name': 'a', 'value': 1}], bases=(LoadedUnitBase,))
+
+        with self.assertRaises(exceptions.RowConversionError) as context:
+            loaders.from_rows('Wrong', [('a', '1', '1'), ('b', '2', 'x')], bases=(LoadedUnitBase,), converters={'value': int, 'weight': float})
+
+        self.assertIn('column "weight" in row 1', str(context.exception))
+
+    def test_from_csv(self):
+        source = io.StringIO('weight,extra,value,name\n0.5,x,1,a\n\n1.5,y,2,b\n')
+
+        relation = loaders.from_csv('CSVRelation', source, bases=(LoadedUnitBase,), converters={'value': int, 'weight': float})
+
+        self.assertEqual(relation.select('name', 'value', 'weight'), (('a', 1, 0.5), ('b', 2, 1.5)))
+
+    def test_from_csv_without_header(self):
+        source = io.StringIO('a;1;0.5\nb;2;1.5\n')
+
+        relation = loaders.from_csv('CSVRelation', source, bases=(LoadedUnitBase,), converters={'value': int}, header=False, delimiter=';')
+
+        self.assertEqual(relation.select('name', 'value', 'weight'), (('a', 1, '0.5'), ('b', 2, '1.5')))
+
+    def test_from_csv_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'units.csv')
+
+            with open(path, 'w', encoding='utf-8') as csv_file:
+                csv_file.write('name,value,weight\nа,1,2\n')
+
+            relation = loaders.from_csv('CSVRelation', path, bases=(LoadedUnitBase,), converters={'value': int})
+
+        self.assertEqual(relation(1).name, 'а')
+
+    def test_from_csv_errors(self):
+        self.assertRaises(exceptions.MissedSourceColumnError,
+                          loaders.from_csv, 'Wrong', io.StringIO('name,weight\na,1\n'), bases=(LoadedUnitBase,))
+        self.assertRaises(exceptions.MissedRowValueError,
+                          loaders.from_csv, 'Wrong', io.StringIO('weight,value,name\n1,2\n'), bases=(LoadedUnitBase,))
+
+    def test_converter_index_error(self):
+        # IndexError, raised by converter, is not confused with missed value
+        converters = {'value': lambda value: int(value.split(':')[1])}
+
+        with self.assertRaises(exceptions.RowConversionError) as context:
+            loaders.from_csv('Wrong', io.StringIO('name,value,weight\na,x:1,1\nb,2,2\n'), bases=(LoadedUnitBase,), converters=converters)
+
+        self.assertIn('column "value" in row 1', str(context.exception))
+
+        with self.assertRaises(exceptions.RowConversionError):
+            loaders.from_rows('Wrong', [('a', '2', 1)], bases=(LoadedUnitBase,), converters=converters)
+
+    def test_from_jsonl(self):
+        source = io.StringIO('{"name": "a", "value": 1, "weight": 0.5}\n\n["b", 2, 1.5]\n')
+
+        relation = loaders.from_jsonl('JSONLRelation', source, bases=(LoadedUnitBase,))
+
+        self.assertEqual(relation.select('name', 'value', 'weight'), (('a', 1, 0.5), ('b', 2, 1.5)))
+
+
+class MappedSourceRelation(Relation):
+    name = Column(primary=True)
+    value = Column(external=True)
+    kind = Column(unique=False, no_index=False)
+    weight = Column(unique=False)
+
+    records = (('first', 1, 'a', 0.5),
+               ('second', 2, 'b', 1.5),
+               ('third', 3, 'a', 2.5))
+
+
+class MappedTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'relation.rels')
+
+        mapped.build(MappedSourceRelation, self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_relation(self, cache_size=None):
+        class MappedUnit(mapped.MappedRelation, path=self.path, cache_size=cache_size):
+            @classmethod
+            def heavy(cls):
+                return cls.filter(weight__gt=1)
+
+        return MappedUnit
+
+    def test_lookups(self):
+        relation = self.create_relation()
+
+        self.assertEqual(len(relation.records), 3)
+        self.assertEqual(relation(2), relation.second)
+        self.assertEqual(relation.index_value[3], relation.third)
+        self.assertEqual(relation.index_kind['a'], (relation.first, relation.third))
+        self.assertEqual(dict(relation.index_kind), {'a': (relation.first, relation.third), 'b': (relation.second,)})
+        self.assertEqual(list(relation.index_value), [1, 2, 3])
+        self.assertNotIn('a', relation.index_value)
+        self.assertEqual(relation.index_value.get(4), None)
+
+        self.assertRaises(exceptions.NotExternalValueError, relation, 4)
+        self.assertRaises(exceptions.NotExternalValueError, relation, 'first')
+        self.assertRaises(AttributeError, getattr, relation, 'fourth')
+
+    def test_records(self):
+        relation = self.create_relation()
+
+        self.assertEqual(relation.records[-1], relation.third)
+        self.assertEqual(relation.records[1:], (relation.second, relation.third))
+        self.assertEqual(list(relation.records), [relation.first, relation.second, relation.third])
+        self.assertEqual(relation.second.weight, 1.5)
+        self.assertEqual(relation.second.ordinal, 1)
+        self.assertEqual(relation.heavy(), (relation.second, relation.third))
+        self.assertTrue(relation.first.is_first)
+        self.assertFalse(relation.first.is_second)
+        self.assertEqual(repr(relation.first), 'MappedUnit.first')
+
+    def test_cache_eviction(self):
+        relation = self.create_relation(cache_size=1)
+
+        first = relation.first
+        relation.second
+
+        self.assertIsNot(relation.first, first)
+        self.assertEqual(relation.first, first)
+        self.assertEqual(len({first, relation.first, relation.second}), 2)
+
+    def test_queries(self):
+        relation = self.create_relation()
+
+        self.assertEqual(relation.select('name', 'weight'), (('first', 0.5), ('second', 1.5), ('third', 2.5)))
+        self.assertEqual(relation.filter(kind='a', value__gt=1), (relation.third,))
+        self.assertEqual(relation.from_values([3, 1]), (relation.third, relation.first))
+        self.assertEqual(list(relation.column('name')), ['first', 'second', 'third'])
+
+    def test_unsupported_values(self):
+        class RecordsRelation(Relation):
+            name = Column(primary=True)
+            value = Column(single_type=False)
+            records = (('first', 1), ('second', 'a'))
+
+        self.assertRaises(exceptions.UnsupportedMappedValueError, mapped.build, RecordsRelation, self.path)
+
+        class CompositeIndexRelation(Relation):
+            name = Column(primary=True)
+            value = Column()
+            index_name_value = Index('name', 'value')
+            records = (('first', 1),)
+
+        self.assertRaises(exceptions.UnsupportedMappedIndexError, mapped.build, CompositeIndexRelation, self.path)
+
+    def test_subsets(self):
+        class SubsetRelation(mapped.MappedRelation, path=self.path):
+            KIND_A = Subset(kind='a')
+
+        self.assertEqual(list(SubsetRelation.KIND_A), [SubsetRelation.first, SubsetRelation.third])
+        self.assertIn(SubsetRelation.third, SubsetRelation.KIND_A)
+
+    def test_wrong_file(self):
+        with open(self.path, 'wb') as wrong_file:
+            wrong_file.write(b'name,value\n')
+
+        self.assertRaises(exceptions.WrongMappedFileError, self.create_relation)
+
+    def test_wrong_attributes(self):
+        with self.assertRaises(exceptions.MappedRelationAttributeError):
+            class WrongRelation(mapped.MappedRelation, path=self.path):
+                extra = Column()
+
+    def test_primaries_duplicate_attributes(self):
+        with self.assertRaises(exceptions.PrimaryDuplicatesRelationAttributeError):
+            class WrongRelation(mapped.MappedRelation, path=self.path):
+                second = 2
+
+
+class MappingSourceRelation(Relation):
+    name = Column(primary=True)
+    value = Column(external=True)
+
+    records = (('first', 1),
+               ('second', 2),
+               ('third', 3))
+
+
+class MappingTargetRelation(Relation):
+    name = Column(primary=True)
+    value = Column(external=True)
+    code = Column()
+
+    records = (('second', 20, 'b'),
+               ('first', 10, 'a'),
+               ('third', 30, 'c'))
+
+
+class MappingTests(TestCase):
+
+    def setUp(self):
+        self.source = MappingSourceRelation
+        self.target = MappingTargetRelation
+        self.mapping = Mapping(self.source, self.target, column='name', bijective=True)
+
+    def test_forward(self):
+        self.assertIs(self.mapping[self.source.first], self.target.first)
+        self.assertIs(self.mapping.get(self.source.third), self.target.third)
+        self.assertEqual(list(self.mapping.items()), [(self.source.first, self.target.first),
+                                                      (self.source.second, self.target.second),
+                                                      (self.source.third, self.target.third)])
+
+    def test_inverse(self):
+        self.assertIs(self.mapping.inverse[self.target.second], self.source.second)
+        self.assertIs(self.mapping.inverse.inverse, self.mapping)
+        self.assertEqual(self.mapping.inverse.translate([self.target.third, self.target.first]),
+                         (self.source.third, self.source.first))
+
+    def test_translate(self):
+        self.assertEqual(self.mapping.translate(iter(self.source.records)),
+                         (self.target.first, self.target.second, self.target.third))
+        self.assertEqual(self.mapping.translate_ordinals([0, 2]), (1, 2))
+
+    def test_immutable(self):
+        record = self.source.first
+
+        self.assertRaises(TypeError, self.mapping.__setitem__, record, self.target.second)
+        self.assertRaises(TypeError, self.mapping.__delitem__, record)
+        self.assertRaises(TypeError, self.mapping.update, {record: self.target.second})
+        self.assertRaises(TypeError, self.mapping.pop, record)
+        self.assertRaises(TypeError, self.mapping.popitem)
+        self.assertRaises(TypeError, self.mapping.setdefault, record, self.target.second)
+        self.assertRaises(TypeError, self.mapping.clear)
+
+        with self.assertRaises(TypeError):
+            self.mapping |= {record: self.target.second}
+
+        self.assertIs(self.mapping[record], self.target.first)
+        self.assertEqual(len(self.mapping), len(self.source.records))
+
+    def test_pickle(self):
+        mapping = pickle.loads(pickle.dumps(self.mapping))
+
+        self.assertEqual(mapping, self.mapping)
+        self.assertIs(mapping.translate([self.source.second])[0], self.target.second)
+        self.assertEqual(mapping.translate_ordinals([0, 2]), (1, 2))
+
+    def test_pairs(self):
+        mapping = Mapping(self.source, self.target, pairs={self.source.first: self.target.third,
+                                                           self.source.second: self.target.third},
+                          total=False)
+
+        self.assertIs(mapping[self.source.second], self.target.third)
+        self.assertEqual(mapping.get(self.source.third), None)
+        self.assertRaises(exceptions.NotMappedRecordError, mapping.__getitem__, self.source.third)
+        self.assertRaises(exceptions.NotInjectiveMappingError, getattr, mapping, 'inverse')
+
+        self.assertEqual(mapping.translate(self.source.records, missing=MISSING.SKIP), (self.target.third, self.target.third))
+
+        with self.assertRaises(exceptions.NotMappedRecordsError) as context:
+            mapping.translate(self.source.records)
+
+        self.assertEqual(context.exception.positions, [2])
+
+    def test_target_column(self):
+        mapping = Mapping(self.target, self.source, column='code', target_column='name', total=False)
+        self.assertEqual(len(mapping), 0)
+
+    def test_wrong_records(self):
+        self.assertRaises(exceptions.WrongMappingRecordError, self.mapping.__getitem__, self.target.first)
+        self.assertRaises(exceptions.WrongMappingRecordError, self.mapping.get, 'first')
+        self.assertRaises(exceptions.WrongMappingRecordError, self.mapping.translate, [self.target.first], missing=MISSING.SKIP)
+        self.assertRaises(exceptions.WrongMappingRecordError, Mapping, self.source, self.target, pairs=[(self.target.first, self.target.first)])
+
+    def test_definition_errors(self):
+        self.assertRaises(exceptions.WrongMappingDefinitionError, Mapping, self.source, self.target)
+        self.assertRaises(exceptions.DuplicateMappingSourceError,
+                          Mapping, self.source, self.target, pairs=[(self.source.first, self.target.first),
+                                                                    (self.source.first, self.target.second)])
+
+    def test_checks(self):
+        pairs = [(self.source.first, self.target.first), (self.source.second, self.target.first)]
+
+        self.assertRaises(exceptions.NotTotalMappingError, Mapping, self.source, self.target, pairs=pairs)
+        self.assertRaises(exceptions.NotInjectiveMappingError,
+                          Mapping, self.source, self.target, pairs=pairs + [(self.source.third, self.target.third)], bijective=True)
+
+        class SmallRelation(Relation):
+            name = Column(primary=True)
+            records = (('first',), ('second',))
+
+        self.assertRaises(exceptions.NotSurjectiveMappingError, Mapping, SmallRelation, self.target, column='name', bijective=True)
+
+
+class TierRelation(Relation):
+    name = Column(primary=True)
+    threshold = Column(unique=False, sorted_index=True)
+    title = Column(sorted_index=True, sorted_index_name='by_title')
+
+    records = (('silver', 100, 'b'),
+               ('bronze', 10, 'c'),
+               ('gold', 1000, 'a'),
+               ('bonus', 100, 'd'))
+
+
+class SortedIndexTests(TestCase):
+
+    def test_order(self):
+        self.assertEqual(list(TierRelation.sorted_threshold),
+                         [TierRelation.bronze, TierRelation.silver, TierRelation.bonus, TierRelation.gold])
+        self.assertEqual(TierRelation.sorted_threshold.keys, (10, 100, 100, 1000))
+        self.assertEqual(len(TierRelation.by_title), 4)
+
+    def test_range(self):
+        index = TierRelation.sorted_threshold
+
+        self.assertEqual(index.range(10, 100), (TierRelation.bronze, TierRelation.silver, TierRelation.bonus))
+        self.assertEqual(index.range(10, 100, include_low=False, include_high=False), ())
+        self.assertEqual(index.range(high=99), (TierRelation.bronze,))
+        self.assertEqual(index.range(low=101), (TierRelation.gold,))
+        self.assertEqual(index.range(500, 50), ())
+        self.assertEqual(TierRelation.by_title.range('b', 'c'), (TierRelation.silver, TierRelation.bronze))
+
+    def test_floor_and_ceiling(self):
+        index = TierRelation.sorted_threshold
+
+        self.assertIs(index.floor(150), TierRelation.bonus)
+        self.assertIs(index.floor(100), TierRelation.bonus)
+        self.assertIs(index.lower(100), TierRelation.bronze)
+        self.assertIs(index.floor(5), None)
+        self.assertIs(index.floor(5, default=TierRelation.bronze), TierRelation.bronze)
+
+        self.assertIs(index.ceiling(50), TierRelation.silver)
+        self.assertIs(index.ceiling(100), TierRelation.silver)
+        self.assertIs(index.higher(100), TierRelation.gold)
+        self.assertIs(index.ceiling(5000), None)
+
+    def test_top_and_bottom(self):
+        index = TierRelation.sorted_threshold
+
+        self.assertEqual(index.top(2), (TierRelation.gold, TierRelation.bonus))
+        self.assertEqual(index.bottom(1), (TierRelation.bronze,))
+        self.assertEqual(len(index.top(10)), 4)
+        self.assertEqual(index.top(0), ())
+        self.assertEqual(index.bottom(-1), ())
+
+    def test_filter(self):
+        self.assertEqual(TierRelation.filter(threshold__gte=100), (TierRelation.silver, TierRelation.gold, TierRelation.bonus))
+        self.assertEqual(TierRelation.filter(threshold__lt=1000, title__gt='b'), (TierRelation.bronze, TierRelation.bonus))
+        self.assertEqual(TierRelation.filter(threshold=100), (TierRelation.silver, TierRelation.bonus))
+
+    def test_unsortable_column(self):
+        with self.assertRaises(exceptions.UnsortableColumnError):
+            class UnsortableRelation(Relation):
+                value = Column(single_type=False, sorted_index=True)
+                records = ((1,), ('a',))
+
+    def test_duplicate_attribute(self):
+        with self.assertRaises(exceptions.IndexDuplicatesRelationAttributeError):
+            class DuplicateRelation(Relation):
+                value = Column(sorted_index=True)
+                sorted_value = None
+                records = ((1,),)
+
+    def test_mapped_relation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tiers.rels')
+
+            mapped.build(TierRelation, path)
+
+            class MappedTier(mapped.MappedRelation, path=path):
+                pass
+
+            self.assertEqual(MappedTier.sorted_threshold.range(50, 100), (MappedTier.silver, MappedTier.bonus))
+            self.assertEqual(MappedTier.sorted_threshold.floor(150), MappedTier.bonus)
+            self.assertEqual(MappedTier.sorted_threshold.top(2), (MappedTier.gold, MappedTier.bonus))
+            self.assertEqual(MappedTier.sorted_threshold.bottom(1), (MappedTier.bronze,))
+            self.assertEqual(MappedTier.by_title.range('b', 'c'), (MappedTier.silver, MappedTier.bronze))
+            self.assertEqual(MappedTier.by_title.higher('c'), MappedTier.bonus)
+            self.assertEqual(MappedTier.filter(threshold__gte=100), (MappedTier.silver, MappedTier.gold, MappedTier.bonus))
+            self.assertEqual(MappedTier.filter(title__lt='c'), (MappedTier.silver, MappedTier.gold))
+
+
+class WeightedRelation(Relation):
+    name = Column(primary=True)
+    frequency = Column(unique=False, single_type=False)
+
+    records = ( ('common', 90),
+                ('rare', 9.5),
+                ('legendary', 0.5),
+                ('never', 0) )
+
+
+class SamplingTests(TestCase):
+
+    def setUp(self):
+        super(SamplingTests, self).setUp()
+        self.rng = random.Random(42)
+
+    def test_random(self):
+        for _ in range(100):
+            self.assertIn(SimplestEnum.random(rng=self.rng), SimplestEnum.records)
+
+    def test_random_exclude(self):
+        for _ in range(100):
+            self.assertIs(SimplestEnum.random(exclude=(SimplestEnum.state_1,), rng=self.rng), SimplestEnum.state_2)
+
+        self.assertIs(SimplestEnum.random(exclude=RecordSet(SimplestEnum, [SimplestEnum.state_2]), rng=self.rng), SimplestEnum.state_1)
+
+        with self.assertRaises(IndexError):
+            SimplestEnum.random(exclude=SimplestEnum.records)
+
+    def test_random_reproducible(self):
+        first_rng, second_rng = random.Random(1), random.Random(1)
+
+        first = [WeightedRelation.random(weight='frequency', rng=first_rng) for _ in range(10)]
+        second = [WeightedRelation.random(weight='frequency', rng=second_rng) for _ in range(10)]
+        self.assertEqual(first, second)
+
+        self.assertEqual(IndexesRelation.sample(2, rng=random.Random(1)), IndexesRelation.sample(2, rng=random.Random(1)))
+
+    def test_sampler_cached(self):
+        self.assertIs(WeightedRelation.sampler(), WeightedRelation.sampler())
+        self.assertIs(WeightedRelation.sampler('frequency'), WeightedRelation.sampler('frequency'))
+        self.assertIsNot(WeightedRelation.sampler(), WeightedRelation.sampler('frequency'))
+
+    def test_weighted_random(self):
+        counts = collections.Counter(WeightedRelation.random(weight='frequency', rng=self.rng) for _ in range(20000))
+
+        self.assertNotIn(WeightedRelation.never, counts)
+        self.assertAlmostEqual(counts[WeightedRelation.common] / 20000, 0.9, delta=0.02)
+        self.assertAlmostEqual(counts[WeightedRelation.rare] / 20000, 0.095, delta=0.02)
+        self.assertTrue(counts[WeightedRelation.legendary] > 0)
+
+    def test_weighted_random_exclude(self):
+        for _ in range(100):
+            self.assertIs(WeightedRelation.random(weight='frequency',
+                                                  exclude=(WeightedRelation.common, WeightedRelation.rare),
+                                                  rng=self.rng),
+                          WeightedRelation.legendary)
+
+        with self.assertRaises(exceptions.ZeroSamplingWeightsError):
+            WeightedRelation.random(weight='frequency', exclude=(WeightedRelation.common, WeightedRelation.rare, WeightedRelation.legendary))
+
+    def test_wrong_weights(self):
+        class WrongWeightRelation(Relation):
+            name = Column(primary=True)
+            weight = Column(unique=False, single_type=False)
+
+            records = ( ('first', 1),
+                        ('second', -1) )
+
+        with self.assertRaises(exceptions.WrongSamplingWeightError):
+            WrongWeightRelation.random(weight='weight')
+
+        with self.assertRaises(exceptions.UnknownColumnError):
+            WrongWeightRelation.random(weight='unknown')
+
+    def test_sample(self):
+        records = IndexesRelation.sample(4, rng=self.rng)
+        self.assertEqual(set(records), set(IndexesRelation.records))
+
+        records = IndexesRelation.sample(10, replace=True, rng=self.rng)
+        self.assertEqual(len(records), 10)
+        self.assertTrue(set(records) <= set(IndexesRelation.records))
+
+        with self.assertRaises(ValueError):
+            IndexesRelation.sample(5)
+
+    def test_sample_exclude(self):
+        records = IndexesRelation.sample(2, exclude=(IndexesRelation.rec_1, IndexesRelation.rec_2), rng=self.rng)
+        self.assertEqual(set(records), {IndexesRelation.rec_3, IndexesRelation.rec_4})
+
+        records = IndexesRelation.sample(20, replace=True,
+                                         exclude=(IndexesRelation.rec_1, IndexesRelation.rec_2, IndexesRelation.rec_3),
+                                         rng=self.rng)
+        self.assertEqual(records, (IndexesRelation.rec_4,) * 20)
+
+    def test_weighted_sample(self):
+        records = WeightedRelation.sample(3, weight='frequency', rng=self.rng)
+        self.assertEqual(set(records), {WeightedRelation.common, WeightedRelation.rare, WeightedRelation.legendary})
+
+        with self.assertRaises(ValueError):
+            WeightedRelation.sample(4, weight='frequency', rng=self.rng)
+
+        records = WeightedRelation.sample(1000, replace=True, weight='frequency', rng=self.rng)
+        self.assertNotIn(WeightedRelation.never, records)
+
+        records = WeightedRelation.sample(10, replace=True, weight='frequency', exclude=(WeightedRelation.common,), rng=self.rng)
+        self.assertNotIn(WeightedRelation.common, records)
@@ -0,0 +1,266 @@
+# coding: utf-8
+import unittest
+
+try:
+    import django
+except ImportError:
+    raise unittest.SkipTest('django is not installed')
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                                              'NAME': ':memory:'}},
+                       INSTALLED_APPS=[])
+    django.setup()
+
+from unittest import TestCase
+
+from django.db import models, connection
+from django.core.exceptions import ValidationError, ImproperlyConfigured, FieldError
+
+from rels.relations import Column
+from rels.record_set import RecordSet
+from rels.django import (DjangoEnum,
+                         relation_column_case,
+                         RelationIntegerField,
+                         RelationSmallIntegerField,
+                         RelationBigIntegerField,
+                         RelationCharField,
+                         RelationSetField)
+
+
+class STATE(DjangoEnum):
+    level = Column(unique=False, single_type=False)
+
+    records = ( ('ACTIVE', 1, 'active', 3),
+                ('REMOVED', 2, 'removed', None),
+                ('DRAFT', 3, 'draft', 1) )
+
+
+class CODE(DjangoEnum):
+    records = ( ('FIRST', 'v1.0', 'first'),
+                ('SECOND', 'v2.0.1', 'second'),
+                ('PLAIN', 'plain', 'plain') )
+
+
+class WIDE(DjangoEnum):
+    records = ( ('SMALL', 1, 'small'),
+                ('LARGE', 2 ** 40, 'large') )
+
+
+class FLAG(DjangoEnum):
+    records = ( ('RED', 1, 'red'),
+                ('GREEN', 2, 'green'),
+                ('BLUE', 3, 'blue') )
+
+
+class Item(models.Model):
+    state = RelationIntegerField(relation=STATE, null=True)
+    code = RelationCharField(relation=CODE, null=True)
+    flags = RelationSetField(relation=FLAG, default=0)
+
+    class Meta:
+        app_label = 'rels_tests'
+
+
+def setUpModule():
+    with connection.schema_editor() as editor:
+        editor.create_model(Item)
+
+
+def tearDownModule():
+    with connection.schema_editor() as editor:
+        editor.delete_model(Item)
+
+
+class DjangoTestsMixin(object):
+
+    def tearDown(self):
+        super(DjangoTestsMixin, self).tearDown()
+        Item.objects.all().delete()
+
+
+class RelationIntegerFieldTests(DjangoTestsMixin, TestCase):
+
+    def setUp(self):
+        super(RelationIntegerFieldTests, self).setUp()
+        self.field = Item._meta.get_field('state')
+
+    def test_from_db_value(self):
+        self.assertIs(self.field.from_db_value(1, None, connection), STATE.ACTIVE)
+        self.assertIs(self.field.from_db_value(None, None, connection), None)
+        self.assertIs(self.field.from_db_value('2', None, connection), STATE.REMOVED)
+
+    def test_get_db_prep_save(self):
+        self.assertEqual(self.field.get_db_prep_save(STATE.DRAFT, connection), 3)
+        self.assertEqual(self.field.get_db_prep_save(2, connection), 2)
+        self.assertIs(self.field.get_db_prep_save(None, connection), None)
+
+    def test_get_db_prep_save_without_integer_adaptation(self):
+        # operations of Django before 4.2 have no adapt_integerfield_value
+        class OldConnection(object):
+            ops = object()
+
+        self.assertEqual(self.field.get_db_prep_save(STATE.DRAFT, OldConnection()), 3)
+
+    def test_bulk_round_trip(self):
+        Item.objects.bulk_create([Item(state=STATE.ACTIVE), Item(state=STATE.DRAFT)])
+
+        self.assertEqual(list(Item.objects.order_by('id').values_list('state', flat=True)), [STATE.ACTIVE, STATE.DRAFT])
+
+        Item.objects.update(state=STATE.REMOVED)
+
+        self.assertEqual(set(Item.objects.values_list('state', flat=True)), {STATE.REMOVED})
+
+
+class RelationColumnCaseTests(DjangoTestsMixin, TestCase):
+
+    def setUp(self):
+        super(RelationColumnCaseTests, self).setUp()
+        self.active = Item.objects.create(state=STATE.ACTIVE)
+        self.removed = Item.objects.create(state=STATE.REMOVED)
+        self.draft = Item.objects.create(state=STATE.DRAFT)
+
+    def test_ordering(self):
+        level = relation_column_case('state', STATE, 'level', output_field=models.IntegerField(), default=0)
+
+        self.assertEqual(list(Item.objects.order_by(level).values_list('id', flat=True)),
+                         [self.removed.id, self.draft.id, self.active.id])
+
+        text = relation_column_case('state', STATE, 'text', output_field=models.CharField())
+
+        self.assertEqual(list(Item.objects.order_by(text).values_list('id', flat=True)),
+                         [self.active.id, self.draft.id, self.removed.id])
+
+        self.assertIs(STATE.projection('value', 'level'), STATE.projection('value', 'level'))
+
+
+class StoredValuesChecksTests(TestCase):
+
+    def test_width_check(self):
+        self.assertRaises(ImproperlyConfigured, RelationSmallIntegerField, relation=WIDE)
+        self.assertRaises(ImproperlyConfigured, RelationIntegerField, relation=WIDE)
+        RelationBigIntegerField(relation=WIDE)
+
+    def test_type_check(self):
+        self.assertRaises(ImproperlyConfigured, RelationIntegerField, relation=CODE)
+        self.assertRaises(ImproperlyConfigured, RelationCharField, relation=STATE)
+
+    def test_char_field_max_length(self):
+        self.assertEqual(Item._meta.get_field('code').max_length, len('v2.0.1'))
+        self.assertEqual(RelationCharField(relation=CODE, max_length=10).max_length, 10)
+        self.assertRaises(ImproperlyConfigured, RelationCharField, relation=CODE, max_length=2)
+
+
+class RelationColumnLookupTests(DjangoTestsMixin, TestCase):
+
+    def setUp(self):
+        super(RelationColumnLookupTests, self).setUp()
+        self.active = Item.objects.create(state=STATE.ACTIVE)
+        self.removed = Item.objects.create(state=STATE.REMOVED)
+        self.draft = Item.objects.create(state=STATE.DRAFT)
+        self.empty = Item.objects.create()
+
+    def get_ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+    def test_filter(self):
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_level=3)), {self.active.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_value__gte=2)), {self.removed.id, self.draft.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_text__in=['active', 'draft'])), {self.active.id, self.draft.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_name__ne='ACTIVE')), {self.removed.id, self.draft.id})
+
+    def test_exclude(self):
+        self.assertEqual(self.get_ids(Item.objects.exclude(state__rel_level=3)), {self.removed.id, self.draft.id, self.empty.id})
+        self.assertEqual(self.get_ids(Item.objects.exclude(state__rel_text__in=['active', 'draft'])), {self.removed.id, self.empty.id})
+
+    def test_empty_selection(self):
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_level=100)), set())
+        self.assertEqual(self.get_ids(Item.objects.exclude(state__rel_level=100)),
+                         {self.active.id, self.removed.id, self.draft.id, self.empty.id})
+
+    def test_none(self):
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_level=None)), {self.removed.id, self.empty.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_level__isnull=True)), {self.removed.id, self.empty.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_level__isnull=False)), {self.active.id, self.draft.id})
+        self.assertEqual(self.get_ids(Item.objects.exclude(state__rel_level=None)), {self.active.id, self.draft.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(state__rel_text=None)), {self.empty.id})
+
+    def test_wrong_usage(self):
+        with self.assertRaises(FieldError):
+            list(Item.objects.filter(state__rel_level__contains=3))
+
+        with self.assertRaises(FieldError):
+            list(Item.objects.annotate(level=models.F('state__rel_level')))
+
+
+class RelationCharFieldTests(DjangoTestsMixin, TestCase):
+
+    def setUp(self):
+        super(RelationCharFieldTests, self).setUp()
+        self.field = Item._meta.get_field('code')
+
+    def test_dotted_stored_values(self):
+        self.assertIs(self.field.to_python('v1.0'), CODE.FIRST)
+        self.assertIs(self.field.to_python('v2.0.1'), CODE.SECOND)
+        self.assertIs(self.field.clean('v1.0', None), CODE.FIRST)
+        self.assertEqual(self.field.get_prep_value('v2.0.1'), 'v2.0.1')
+
+    def test_primary_notation(self):
+        self.assertIs(self.field.to_python('CODE.SECOND'), CODE.SECOND)
+        self.assertEqual(self.field.get_prep_value('CODE.SECOND'), 'v2.0.1')
+
+        self.assertRaises(ValidationError, self.field.to_python, 'STATE.ACTIVE')
+        self.assertRaises(ValidationError, self.field.to_python, 'CODE.UNKNOWN.VALUE')
+
+    def test_round_trip(self):
+        Item.objects.create(code=CODE.FIRST)
+        Item.objects.create(code='v2.0.1')
+
+        self.assertEqual(Item.objects.get(code='v1.0').code, CODE.FIRST)
+        self.assertEqual(Item.objects.get(code=CODE.SECOND).code, CODE.SECOND)
+        self.assertEqual(Item.objects.filter(code__in=['v1.0', 'CODE.SECOND']).count(), 2)
+
+
+class RelationSetFieldTests(DjangoTestsMixin, TestCase):
+
+    def setUp(self):
+        super(RelationSetFieldTests, self).setUp()
+        self.red = Item.objects.create(flags=RecordSet(FLAG, [FLAG.RED]))
+        self.red_green = Item.objects.create(flags=[FLAG.RED, FLAG.GREEN])
+        self.empty = Item.objects.create()
+
+    def get_ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+    def test_round_trip(self):
+        item = Item.objects.get(id=self.red_green.id)
+        self.assertEqual(item.flags, RecordSet(FLAG, [FLAG.RED, FLAG.GREEN]))
+        self.assertEqual(Item.objects.get(id=self.empty.id).flags, RecordSet(FLAG))
+
+    def test_has_any(self):
+        self.assertEqual(self.get_ids(Item.objects.filter(flags__has_any=[FLAG.GREEN, FLAG.BLUE])), {self.red_green.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(flags__has_any=RecordSet(FLAG, [FLAG.RED]))), {self.red.id, self.red_green.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(flags__has_any=[FLAG.BLUE])), set())
+
+    def test_has_all(self):
+        self.assertEqual(self.get_ids(Item.objects.filter(flags__has_all=[FLAG.RED, FLAG.GREEN])), {self.red_green.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(flags__has_all=[FLAG.RED])), {self.red.id, self.red_green.id})
+        self.assertEqual(self.get_ids(Item.objects.filter(flags__has_all=[])), {self.red.id, self.red_green.id, self.empty.id})
+
+    def test_from_db_value(self):
+        field = Item._meta.get_field('flags')
+
+        self.assertEqual(field.from_db_value(5, None, connection), RecordSet(FLAG, [FLAG.RED, FLAG.BLUE]))
+        self.assertIs(field.from_db_value(None, None, connection), None)
+
+    def test_historical_field(self):
+        # fields of historical models in migrations are created from deconstruct, without relation
+        name, path, args, kwargs = Item._meta.get_field('flags').deconstruct()
+
+        field = RelationSetField(*args, **kwargs)
+
+        self.assertEqual(field.from_db_value(5, None, connection), 5)
+        self.assertEqual(field.to_python(5), 5)
+        self.assertEqual(field.get_prep_value(5), 5)
@@ -31,4 +31,5 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     include_package_data=True,
     test_suite = 'tests',
+    entry_points={'console_scripts': ['rels-check=rels.checker:main']},
     )